@@ -0,0 +1,446 @@
+# ai_worker.py
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from chess_ai import ChessAI, board_from_history
+from profiling import profile_call
+from search_cache import SearchCache
+from transposition import TranspositionTable
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Per-process state inside the workers
+_worker_tables = OrderedDict()
+_stop_times = None
+_search_cache = SearchCache()
+
+# Transposition tables each worker keeps for recently searched games; a worker's table memory
+# is up to WORKER_TABLES x AI_TT_SIZE_MB
+WORKER_TABLES = int(os.getenv("AI_WORKER_TABLES", 16))
+
+# Pondering: search the opponent's expected reply between moves, for at most this many seconds
+PONDER_ENABLED = os.getenv("AI_PONDER", "true").lower() in ("1", "true", "yes")
+PONDER_MAX_TIME = float(os.getenv("AI_PONDER_MAX_TIME", 60))
+
+
+def _init_worker(stop_times):
+    """Worker initializer: keep the shared stop-time registry"""
+    global _stop_times
+    _stop_times = stop_times
+
+
+def _get_table(game_id: str) -> TranspositionTable:
+    """Return this worker's table for a game, evicting the least recently used one"""
+    table = _worker_tables.pop(game_id, None)
+    if table is None:
+        table = TranspositionTable()
+        while len(_worker_tables) >= WORKER_TABLES:
+            _worker_tables.popitem(last=False)
+    _worker_tables[game_id] = table
+    return table
+
+
+def run_search(job_id: int, game_id: str, fen: str, limits: dict) -> dict:
+    """Search a position inside a worker process and return a picklable result"""
+    board = board_from_history(fen, limits.get('history'))
+
+    def stop_check():
+        # 0 means cancelled; a later time is the deadline given to a ponder that was hit
+        if _stop_times is None:
+            return False
+        stop_at = _stop_times.get(job_id)
+        return stop_at is not None and time.time() >= stop_at
+
+    search_args = {
+        'depth': limits.get('depth'),
+        'table': _get_table(game_id),
+        'time_limit': limits.get('time_limit'),
+        'node_limit': limits.get('node_limit'),
+        'stop_check': stop_check,
+        'cache': _search_cache,
+        'noise': limits.get('noise', 0)
+    }
+    profile = None
+    if limits.get('profile'):
+        # Profiled searches skip the shared result cache so there is a search to look at
+        search_args['cache'] = None
+        result, profile = profile_call(ChessAI.search, board, **search_args)
+    else:
+        result = ChessAI.search(board, **search_args)
+
+    return {
+        'move': result.move.uci() if result.move else None,
+        'score': result.score,
+        'depth': result.depth,
+        'nodes': result.nodes,
+        'qnodes': result.qnodes,
+        'time_ms': result.time_ms,
+        'from_book': result.from_book,
+        'from_cache': result.from_cache,
+        'ponder': result.ponder_move.uci() if result.ponder_move else None,
+        'profile': profile,
+        # Running totals of this worker's search cache, gathered by AIWorkerPool.get_stats
+        'cache_stats': (os.getpid(), _search_cache.counters())
+    }
+
+
+class AIWorkerPool:
+    """Runs AI searches in worker processes so they never block the IOLoop.
+
+    At most ``max_queue`` searches are queued or running at once; further requests wait
+    their turn (FIFO). Each game has at most one search in flight and it can be cancelled.
+    A game goes back to the worker that searched it last when that worker is free, so the
+    worker's transposition table for the game is reused.
+
+    Between moves the pool ponders: it searches the position after the opponent's expected
+    reply on an idle worker, within the limits the real search would have. Ponders only start
+    on idle workers and give way to any real search that needs one. If the opponent plays the
+    expected move, the ponder result is returned at once, or the running ponder is left to
+    finish; its reported ``time_ms`` only counts the time after the hit. Otherwise the ponder
+    is stopped and the next search reuses its table on the same worker.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 ponder: Optional[bool] = None):
+        self.max_workers = max_workers or int(os.getenv("AI_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+        self.max_queue = max_queue or int(os.getenv("AI_QUEUE_SIZE", self.max_workers * 4))
+        self.ponder_enabled = PONDER_ENABLED if ponder is None else ponder
+        self._executors = []
+        self._manager = None
+        self._stop_times = None
+        self._slots = None
+        self._jobs = {}
+        self._ponders = {}
+        self._running = []
+        self._affinity = {}
+        self._profiles = {}
+        # Latest search cache counters of each worker process, by pid
+        self._cache_stats = {}
+        self._next_job_id = 0
+
+        # Counters
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.waiting = 0
+        self.ponders = 0
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self.ponders_preempted = 0
+        self.worker_restarts = 0
+
+    def start(self):
+        """Spawn the worker processes (called lazily on first use)"""
+        if self._executors:
+            return
+        self._manager = multiprocessing.get_context("spawn").Manager()
+        self._stop_times = self._manager.dict()
+        # One single-process executor per worker so a game can be sent back to the same process
+        self._executors = [self._new_executor() for _ in range(self.max_workers)]
+        self._running = [0] * self.max_workers
+        logger.info(f"AI worker pool started with {self.max_workers} processes")
+
+    def shutdown(self):
+        if self._executors:
+            for executor in self._executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._executors = []
+            self._manager = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._stop_times,)
+        )
+
+    def _replace_worker(self, worker: int, executor: ProcessPoolExecutor):
+        """Start a fresh process for a worker whose process died (once per broken executor)"""
+        if self._executors[worker] is not executor:
+            return
+        logger.error(f"AI worker {worker} died, starting a new process")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executors[worker] = self._new_executor()
+        self.worker_restarts += 1
+
+    def _launch(self, worker: int, job_id: int, game_id: str, fen: str, limits: dict):
+        """Start a search on one worker and return its concurrent future.
+
+        Raises ``BrokenProcessPool`` if the worker's process has died.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._executors[worker].submit(run_search, job_id, game_id, fen, limits)
+        self._running[worker] += 1
+        future.add_done_callback(lambda done: loop.call_soon_threadsafe(self._finished, worker, job_id, done))
+        return future
+
+    def _finished(self, worker: int, job_id: int, future):
+        self._running[worker] -= 1
+        self._stop_times.pop(job_id, None)
+        if not future.cancelled() and future.exception() is None:
+            pid, counters = future.result()['cache_stats']
+            self._cache_stats[pid] = counters
+
+    def _stop(self, job_id: int, future, stop_at: float = 0):
+        """Ask a running search to stop at ``stop_at`` (now by default)"""
+        if not future.done() and self._stop_times is not None:
+            self._stop_times[job_id] = stop_at
+
+    def _pick_worker(self, game_id: str, stopping: Optional[int] = None) -> int:
+        """Worker for a real search: the game's last worker if idle, else any idle one.
+
+        ``stopping`` is the worker of the game's ponder that was just stopped; it is chosen while
+        that ponder is its only job, since it holds the game's table and frees up within moments.
+        """
+        if stopping is not None and self._running[stopping] <= 1:
+            return stopping
+        preferred = self._affinity.get(game_id)
+        if preferred is not None and self._running[preferred] == 0:
+            return preferred
+        for worker, running in enumerate(self._running):
+            if running == 0:
+                return worker
+
+        # Every worker is busy: a ponder gives way to the real search
+        for ponder_game, ponder in list(self._ponders.items()):
+            if not ponder['future'].done():
+                self.stop_ponder(ponder_game)
+                self.ponders_preempted += 1
+                return ponder['worker']
+
+        if preferred is not None:
+            return preferred
+        return min(range(len(self._running)), key=self._running.__getitem__)
+
+    async def submit(self, game_id: str, fen: str, depth: Optional[int] = None,
+                     time_limit: Optional[float] = None, node_limit: Optional[int] = None,
+                     noise: int = 0, history: Optional[tuple] = None) -> Optional[dict]:
+        """Search ``fen`` for a game and return the result, or None if the job was cancelled.
+
+        ``history`` is ``chess_ai.history_since_reset`` of the game's board, for repetitions.
+        """
+        self.start()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+
+        # A ponder for this game either already searched this position or is now useless
+        stopping = None
+        ponder = self._ponders.pop(game_id, None)
+        if ponder is not None:
+            if ponder['fen'] == fen:
+                self.ponder_hits += 1
+                try:
+                    return await self._take_ponder(game_id, ponder, time_limit)
+                except BrokenProcessPool:
+                    # The ponder's worker died: search the position from scratch
+                    self._replace_worker(ponder['worker'], ponder['executor'])
+            self.ponder_misses += 1
+            self._stop(ponder['id'], ponder['future'])
+            stopping = ponder['worker']
+
+        # A newer search for the same game supersedes the old one
+        self._cancel_job(game_id)
+
+        self._next_job_id += 1
+        job_id = self._next_job_id
+        job = self._jobs[game_id] = {'id': job_id, 'future': None, 'task': asyncio.current_task()}
+        self.submitted += 1
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            return None
+        finally:
+            self.waiting -= 1
+
+        limits = {'depth': depth, 'time_limit': time_limit, 'node_limit': node_limit, 'noise': noise,
+                  'history': history}
+        profile_waiter = self._profiles.pop(game_id, None)
+        if profile_waiter is not None and profile_waiter.done():
+            # Its requester gave up waiting
+            profile_waiter = None
+        limits['profile'] = profile_waiter is not None
+        try:
+            for attempt in range(2):
+                worker = self._pick_worker(game_id, stopping)
+                self._affinity[game_id] = worker
+                executor = self._executors[worker]
+                try:
+                    job['future'] = self._launch(worker, job_id, game_id, fen, limits)
+                    result = await asyncio.wrap_future(job['future'])
+                    break
+                except BrokenProcessPool:
+                    # The worker process died (killed, out of memory): replace it and retry once
+                    self._replace_worker(worker, executor)
+                    stopping = None
+                    if attempt:
+                        raise
+        except asyncio.CancelledError:
+            if profile_waiter is not None:
+                # Profile the game's next search instead
+                self._profiles.setdefault(game_id, profile_waiter)
+            return None
+        finally:
+            self._slots.release()
+            if self._jobs.get(game_id) is job:
+                del self._jobs[game_id]
+
+        if profile_waiter is not None and not profile_waiter.done():
+            profile_waiter.set_result(result.get('profile'))
+        if job.get('cancelled'):
+            return None
+        self.completed += 1
+        return result
+
+    def profile_next(self, game_id: str) -> asyncio.Future:
+        """Profile the next search submitted for a game; the future gets the pstats text"""
+        waiter = self._profiles.get(game_id)
+        if waiter is None or waiter.done():
+            waiter = self._profiles[game_id] = asyncio.get_running_loop().create_future()
+        return waiter
+
+    def cancel_profile(self, game_id: str, waiter: asyncio.Future):
+        """Withdraw a ``profile_next`` request, so no later search of the game is profiled for it"""
+        if self._profiles.get(game_id) is waiter:
+            del self._profiles[game_id]
+        waiter.cancel()
+
+    async def _take_ponder(self, game_id: str, ponder: dict, time_limit: Optional[float]) -> Optional[dict]:
+        """Turn a ponder that predicted the position into the game's search"""
+        self._cancel_job(game_id)
+        job = self._jobs[game_id] = {'id': ponder['id'], 'future': ponder['future'],
+                                     'task': asyncio.current_task()}
+        self.submitted += 1
+        hit_time = time.monotonic()
+
+        # Still searching: it may go on for the move's normal time limit
+        if time_limit:
+            self._stop(ponder['id'], ponder['future'], time.time() + time_limit)
+        try:
+            result = await asyncio.wrap_future(ponder['future'])
+        except asyncio.CancelledError:
+            return None
+        finally:
+            if self._jobs.get(game_id) is job:
+                del self._jobs[game_id]
+
+        if job.get('cancelled'):
+            return None
+        self.completed += 1
+        # Time spent pondering was the player's; only the wait after the hit is the AI's
+        return dict(result, ponder_hit=True, ponder_ms=result['time_ms'],
+                    time_ms=int((time.monotonic() - hit_time) * 1000))
+
+    def ponder(self, game_id: str, fen: str, depth: Optional[int] = None, node_limit: Optional[int] = None,
+               noise: int = 0, history: Optional[tuple] = None, time_limit: Optional[float] = None) -> bool:
+        """Search ``fen``, the position after the opponent's expected reply, if a worker is idle.
+
+        The ponder gets the same limits as the real search would, and never more than
+        ``PONDER_MAX_TIME`` seconds.
+        """
+        if not self.ponder_enabled or not self._executors:
+            return False
+        self.stop_ponder(game_id)
+
+        idle = [worker for worker, running in enumerate(self._running) if running == 0]
+        if not idle or self.waiting:
+            return False
+        worker = self._affinity.get(game_id)
+        if worker not in idle:
+            worker = idle[0]
+        self._affinity[game_id] = worker
+
+        self._next_job_id += 1
+        job_id = self._next_job_id
+        time_limit = min(time_limit, PONDER_MAX_TIME) if time_limit else PONDER_MAX_TIME
+        limits = {'depth': depth, 'time_limit': time_limit, 'node_limit': node_limit, 'noise': noise,
+                  'history': history}
+        executor = self._executors[worker]
+        try:
+            future = self._launch(worker, job_id, game_id, fen, limits)
+        except BrokenProcessPool:
+            self._replace_worker(worker, executor)
+            return False
+        self._ponders[game_id] = {'id': job_id, 'fen': fen, 'future': future, 'worker': worker,
+                                  'executor': executor}
+        self.ponders += 1
+        return True
+
+    def stop_ponder(self, game_id: str):
+        """Stop and forget the ponder for a game, if any"""
+        ponder = self._ponders.pop(game_id, None)
+        if ponder is not None:
+            self._stop(ponder['id'], ponder['future'])
+
+    def _cancel_job(self, game_id: str):
+        job = self._jobs.pop(game_id, None)
+        if job is None:
+            return
+        job['cancelled'] = True
+        self.cancelled += 1
+        future = job['future']
+        if future is None:
+            # Still waiting for a slot
+            if job['task'] is not None:
+                job['task'].cancel()
+        elif not future.cancel():
+            # Already running: ask the search to stop at its next check
+            self._stop(job['id'], future)
+
+    def cancel(self, game_id: str):
+        """Cancel the queued or running search and the ponder for a game, if any"""
+        self._cancel_job(game_id)
+        self.stop_ponder(game_id)
+        self._affinity.pop(game_id, None)
+
+    def has_job(self, game_id: str) -> bool:
+        """Whether a search is queued or running for a game"""
+        return game_id in self._jobs
+
+    def get_stats(self) -> dict:
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'busy_workers': sum(1 for running in self._running if running),
+            'in_flight': len(self._jobs),
+            'waiting': self.waiting,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'ponders': self.ponders,
+            'pondering': sum(1 for ponder in self._ponders.values() if not ponder['future'].done()),
+            'ponder_hits': self.ponder_hits,
+            'ponder_misses': self.ponder_misses,
+            'ponders_preempted': self.ponders_preempted,
+            'worker_restarts': self.worker_restarts,
+            'search_cache': self._search_cache_stats()
+        }
+
+    def _search_cache_stats(self) -> dict:
+        """Search cache counters summed over every worker process, including replaced ones"""
+        totals = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'errors': 0}
+        for counters in self._cache_stats.values():
+            for name in totals:
+                totals[name] += counters.get(name, 0)
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+        return totals
+
+
+# Shared pool used by the websocket handlers
+ai_pool = AIWorkerPool()
@@ -0,0 +1,243 @@
+# batch_eval.py
+"""
+Vectorized evaluation of many positions at once (post-game analysis, book building, tuning).
+
+Boards are converted to an N x 12 x 64 array of piece planes and every term of
+``ChessAI.evaluate_position`` is computed with NumPy array operations: material and
+piece-square tables, pawn structure, king safety and pseudo-legal mobility.
+
+Tolerance: for positions that are not terminal the scores are identical to
+``ChessAI.evaluate_position`` (default, attack-set mobility), i.e. the tolerance is 0.
+Checkmate, stalemate and insufficient material are only recognised when ``terminal=True``
+is passed, because detecting them needs per-board legal move generation; otherwise those
+positions get their static score.
+"""
+
+import time
+import random
+from typing import List, Sequence
+
+import chess
+
+from chess_ai import ChessAI, IncrementalEvaluator
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+# Plane index of each piece: white P N B R Q K, then black
+PLANES = [(color, piece_type) for color in (chess.WHITE, chess.BLACK) for piece_type in chess.PIECE_TYPES]
+
+ORTHOGONAL = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+_tables = None
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("batch evaluation needs NumPy: pip install numpy")
+
+
+def _square_matrix(masks: Sequence[int]):
+    """64 x 64 matrix with [square, target] = 1 when ``target`` is in ``masks[square]``"""
+    matrix = np.zeros((64, 64), dtype=np.float32)
+    for square in chess.SQUARES:
+        for target in chess.scan_forward(masks[square]):
+            matrix[square, target] = 1
+    return matrix
+
+
+def _get_tables() -> dict:
+    """Precomputed weight and attack tables, built on first use"""
+    global _tables
+    if _tables is None:
+        _require_numpy()
+        values = np.array([IncrementalEvaluator.VALUES[color][piece_type] for color, piece_type in PLANES],
+                          dtype=np.float32)
+        _tables = {
+            'values': values,
+            'knight': _square_matrix(chess.BB_KNIGHT_ATTACKS),
+            'king': _square_matrix(chess.BB_KING_ATTACKS),
+            'pawn': {color: _square_matrix(chess.BB_PAWN_ATTACKS[color]) for color in chess.COLORS},
+            'passed': {color: _square_matrix(ChessAI.PASSED_PAWN_MASKS[color]) for color in chess.COLORS},
+            'castled': {
+                color: np.isin(np.arange(64), ChessAI.CASTLED_KING_SQUARES[color]).astype(np.float32)
+                for color in chess.COLORS
+            },
+            'rank3': np.array([chess.square_rank(sq) == 2 for sq in chess.SQUARES], dtype=np.float32),
+            'rank6': np.array([chess.square_rank(sq) == 5 for sq in chess.SQUARES], dtype=np.float32),
+        }
+    return _tables
+
+
+def boards_to_planes(boards: Sequence[chess.Board]):
+    """Convert boards to an (N, 12, 64) uint8 array of piece planes"""
+    _require_numpy()
+    bitboards = np.array(
+        [board.pieces_mask(piece_type, color) for board in boards for color, piece_type in PLANES],
+        dtype='<u8'
+    )
+    planes = np.unpackbits(bitboards.view(np.uint8).reshape(len(boards), 12, 8), axis=-1, bitorder='little')
+    return planes.reshape(len(boards), 12, 64)
+
+
+def _shift(squares, rank_step: int, file_step: int):
+    """Shift (N, 64) square arrays by whole ranks/files, dropping what falls off the board"""
+    grid = squares.reshape(-1, 8, 8)
+    out = np.zeros_like(grid)
+    out[:, max(rank_step, 0):8 + min(rank_step, 0), max(file_step, 0):8 + min(file_step, 0)] = \
+        grid[:, max(-rank_step, 0):8 - max(rank_step, 0), max(-file_step, 0):8 - max(file_step, 0)]
+    return out.reshape(-1, 64)
+
+
+def _ray_counts(origins, empty, directions):
+    """Per-square count of sliding rays from ``origins`` reaching it (first blocker included)"""
+    reached = np.zeros_like(origins)
+    for rank_step, file_step in directions:
+        frontier = origins
+        for _ in range(7):
+            frontier = _shift(frontier, rank_step, file_step)
+            if not frontier.any():
+                break
+            reached += frontier
+            frontier = frontier * empty
+    return reached
+
+
+def _evaluate_planes(planes):
+    tables = _get_tables()
+    # float32 keeps every count and score exact here and lets the matrix products use BLAS
+    pieces = planes.astype(np.float32)
+    white = pieces[:, :6].sum(axis=1)
+    black = pieces[:, 6:].sum(axis=1)
+    occupied = white + black
+    empty = 1 - occupied
+    own = {chess.WHITE: white, chess.BLACK: black}
+
+    def plane(color, piece_type):
+        return pieces[:, (0 if color else 6) + piece_type - 1]
+
+    # Material and piece-square tables
+    score = pieces.reshape(len(pieces), -1) @ tables['values'].reshape(-1)
+
+    rook_like = {color: plane(color, chess.ROOK) + plane(color, chess.QUEEN) for color in chess.COLORS}
+    bishop_like = {color: plane(color, chess.BISHOP) + plane(color, chess.QUEEN) for color in chess.COLORS}
+
+    for color in chess.COLORS:
+        sign = 1 if color == chess.WHITE else -1
+        enemy = not color
+        pawns = plane(color, chess.PAWN)
+        king = plane(color, chess.KING)
+
+        # Mobility: attacked squares not occupied by own pieces, plus pawn pushes and captures
+        not_own = 1 - own[color]
+        mobility = ((plane(color, chess.KNIGHT) @ tables['knight']) * not_own).sum(axis=1)
+        mobility += ((king @ tables['king']) * not_own).sum(axis=1)
+        mobility += (_ray_counts(rook_like[color], empty, ORTHOGONAL) * not_own).sum(axis=1)
+        mobility += (_ray_counts(bishop_like[color], empty, DIAGONAL) * not_own).sum(axis=1)
+
+        forward = 1 if color == chess.WHITE else -1
+        single = _shift(pawns, forward, 0) * empty
+        double = _shift(single * tables['rank3' if color == chess.WHITE else 'rank6'], forward, 0) * empty
+        mobility += single.sum(axis=1) + double.sum(axis=1)
+        mobility += ((pawns @ tables['pawn'][color]) * own[enemy]).sum(axis=1)
+        score += sign * mobility * ChessAI.MOBILITY_WEIGHT
+
+        # King safety: castled bonus and a penalty per attacking enemy piece
+        safety = (king * tables['castled'][color]).sum(axis=1) * 30
+        attackers = ((king @ tables['knight']) * plane(enemy, chess.KNIGHT)).sum(axis=1)
+        attackers += ((king @ tables['king']) * plane(enemy, chess.KING)).sum(axis=1)
+        attackers += ((king @ tables['pawn'][color]) * plane(enemy, chess.PAWN)).sum(axis=1)
+        attackers += (_ray_counts(king, empty, ORTHOGONAL) * rook_like[enemy]).sum(axis=1)
+        attackers += (_ray_counts(king, empty, DIAGONAL) * bishop_like[enemy]).sum(axis=1)
+        safety -= attackers * 20
+        score += sign * safety * (king.sum(axis=1) > 0)
+
+        # Pawn structure: doubled, isolated and passed pawns
+        file_counts = pawns.reshape(-1, 8, 8).sum(axis=1)
+        structure = -np.maximum(file_counts - 1, 0).sum(axis=1) * 20
+        has_pawn = file_counts > 0
+        neighbours = np.zeros_like(has_pawn)
+        neighbours[:, 1:] |= has_pawn[:, :-1]
+        neighbours[:, :-1] |= has_pawn[:, 1:]
+        structure -= (file_counts * ~neighbours).sum(axis=1) * 25
+        blocked = plane(enemy, chess.PAWN) @ tables['passed'][color].T
+        structure += (pawns * (blocked == 0)).sum(axis=1) * 50
+        score += sign * structure
+
+    return score.astype(np.float64)
+
+
+def evaluate_boards(boards: Sequence[chess.Board], terminal: bool = False):
+    """Evaluate many boards at once, returning a float array of White-relative scores.
+
+    With ``terminal=True`` checkmates, stalemates and insufficient material are scored the way
+    ``ChessAI.evaluate_position`` scores them (this costs a legal move generation per board).
+    """
+    _require_numpy()
+    if not boards:
+        return np.zeros(0, dtype=np.float64)
+
+    scores = _evaluate_planes(boards_to_planes(boards))
+
+    if terminal:
+        for index, board in enumerate(boards):
+            if board.is_checkmate():
+                scores[index] = -20000 if board.turn else 20000
+            elif board.is_stalemate() or board.is_insufficient_material():
+                scores[index] = 0
+    return scores
+
+
+def random_positions(count: int, seed: int = 0, max_plies: int = 120) -> List[chess.Board]:
+    """Positions reached by random play, for benchmarks and consistency checks"""
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(0, max_plies)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+def benchmark(count: int = 5000, seed: int = 0) -> dict:
+    """Compare batch and one-at-a-time evaluation throughput on random positions"""
+    boards = random_positions(count, seed)
+    _get_tables()
+
+    start = time.perf_counter()
+    batch_scores = evaluate_boards(boards)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_scores = evaluate_boards(boards, terminal=True)
+    terminal_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar_scores = [ChessAI.evaluate_position(board) for board in boards]
+    scalar_time = time.perf_counter() - start
+
+    return {
+        'positions': count,
+        'batch_positions_per_second': round(count / batch_time),
+        'batch_terminal_positions_per_second': round(count / terminal_time),
+        'scalar_positions_per_second': round(count / scalar_time),
+        'max_abs_difference': float(np.max(np.abs(batch_scores - np.array(scalar_scores)))),
+    }
+
+
+def main():
+    print("Batch evaluation benchmark")
+    print("=" * 26)
+    for key, value in benchmark().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,254 @@
 # chess_ai.py
+import os
+import math
+import time
 import chess
 import random
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+from opening_book import OpeningBook
+from search_cache import SearchCache
+from transposition import (TranspositionTable, zobrist_key, castling_key, en_passant_key, move_key_delta,
+                           EXACT, LOWER_BOUND, UPPER_BOUND)
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when the time or node budget is exhausted"""
+
+
+@dataclass
+class SearchResult:
+    move: Optional[chess.Move] = None
+    score: float = 0
+    depth: int = 0
+    nodes: int = 0
+    qnodes: int = 0
+    time_ms: int = 0
+    first_move_cutoff_rate: float = 0.0
+    from_book: bool = False
+    from_cache: bool = False
+    # Expected reply to ``move``, taken from the transposition table (used for pondering)
+    ponder_move: Optional[chess.Move] = None
+
+
+@dataclass(frozen=True)
+class AILevel:
+    """Named AI strength: search limits plus random noise (centipawns) added to evaluations"""
+    name: str
+    depth: int
+    time_limit: float
+    node_limit: int
+    noise: int = 0
+
+
+class SearchContext:
+    """Per-search state: transposition table, budgets and counters"""
+
+    # How often (in nodes) the clock is checked
+    CHECK_INTERVAL = 256
+
+    def __init__(self, table: Optional[TranspositionTable] = None, time_limit: Optional[float] = None,
+                 node_limit: Optional[int] = None, root_ply: int = 0,
+                 stop_check: Optional[Callable[[], bool]] = None, noise: int = 0):
+        self.table = table
+        self.node_limit = node_limit
+        self.stop_check = stop_check
+        self.start_time = time.monotonic()
+        self.deadline = self.start_time + time_limit if time_limit else None
+        self.root_ply = root_ply
+        self.nodes = 0
+        self.qnodes = 0
+        self.completed_depth = 0
+        self.iteration_depth = 0
+
+        # Incremental material/PST accumulator and Zobrist key stack, set up by attach()
+        self.evaluator = None
+        self.key = 0
+        self.castling = 0
+        self.keys = []
+        self.key_stack = []
+
+        # Evaluation noise used to weaken the lower difficulty levels
+        self.noise = noise
+
+        # Move ordering state
+        self.killers = {}
+        self.history = {}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def count_node(self):
+        """Count a main-search node and abort the search once a budget is exhausted"""
+        self.nodes += 1
+        self.check_budget()
+
+    def count_qnode(self):
+        """Count a quiescence node and abort the search once a budget is exhausted"""
+        self.qnodes += 1
+        self.check_budget()
+
+    def check_budget(self):
+        total = self.nodes + self.qnodes
+        if self.stop_check is not None and total % self.CHECK_INTERVAL == 0:
+            if self.stop_check():
+                raise SearchAborted()
+        if self.completed_depth == 0:
+            # Always finish the first iteration so there is a move to play
+            return
+        if self.node_limit is not None and total > self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and total % self.CHECK_INTERVAL == 0:
+            if time.monotonic() >= self.deadline:
+                raise SearchAborted()
+
+    def attach(self, board: chess.Board):
+        """Start tracking ``board``: material/PST accumulator and Zobrist keys.
+
+        The key stack is seeded with the game positions since the last irreversible move,
+        so repetitions of positions played before the search are found too.
+        """
+        self.evaluator = IncrementalEvaluator(board)
+        self.key = zobrist_key(board)
+        self.castling = castling_key(board)
+        self.key_stack = []
+
+        history = board.copy()
+        keys = [self.key]
+        for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+            history.pop()
+            keys.append(zobrist_key(history))
+        self.keys = keys[::-1]
+
+    def push(self, board: chess.Board, move: chess.Move):
+        """Make a move, keeping the incremental evaluator and the Zobrist key in sync"""
+        key = self.key ^ move_key_delta(board, move)
+        rights = board.castling_rights
+        if self.evaluator is not None:
+            self.evaluator.push(board, move)
+        else:
+            board.push(move)
+
+        key ^= en_passant_key(board)
+        castling = self.castling
+        if board.castling_rights != rights:
+            castling = castling_key(board)
+            key ^= self.castling ^ castling
+
+        self.key_stack.append((self.key, self.castling))
+        self.key = key
+        self.castling = castling
+        self.keys.append(key)
+
+    def pop(self, board: chess.Board):
+        """Unmake the last move, keeping the incremental evaluator and the Zobrist key in sync"""
+        if self.evaluator is not None:
+            self.evaluator.pop(board)
+        else:
+            board.pop()
+        self.keys.pop()
+        self.key, self.castling = self.key_stack.pop()
+
+    def is_repetition(self, board: chess.Board) -> bool:
+        """Whether the current position already occurred since the last irreversible move"""
+        keys = self.keys
+        last = len(keys) - 1
+        stop = max(last - board.halfmove_clock, 0)
+        # The same side must be to move, and it takes at least four plies to get back
+        for index in range(last - 4, stop - 1, -2):
+            if keys[index] == self.key:
+                return True
+        return False
+
+    @staticmethod
+    def terminal_score(board: chess.Board) -> float:
+        """Score of a position without legal moves: checkmate or stalemate"""
+        if board.is_check():
+            return -20000 if board.turn else 20000
+        return 0
+
+    def evaluate(self, board: chess.Board) -> float:
+        """Static evaluation, reading material and PST from the accumulator when available"""
+        # The search detects checkmate and stalemate from its own move lists
+        if self.evaluator is not None:
+            score = ChessAI.evaluate_position(board, self.evaluator.score, check_terminal=False)
+        else:
+            score = ChessAI.evaluate_position(board, check_terminal=False)
+        if self.noise and abs(score) < ChessAI.PIECE_VALUES[chess.KING]:
+            score += random.randint(-self.noise, self.noise)
+        return score
+
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self.start_time) * 1000)
+
+    def record_cutoff(self, board: chess.Board, move: chess.Move, move_index: int, depth: int):
+        """Update cutoff counters, killers and history after a beta cutoff"""
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+        if board.is_capture(move) or move.promotion:
+            return
+
+        ply = len(board.move_stack) - self.root_ply
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+
+        key = (board.turn, move.from_square, move.to_square)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def first_move_cutoff_rate(self) -> float:
+        return round(self.first_move_cutoffs / self.cutoffs, 4) if self.cutoffs else 0.0
+
+
+def _adjacent_files_mask(file: int) -> int:
+    """Files either side of ``file``"""
+    mask = 0
+    for adj_file in (file - 1, file + 1):
+        if 0 <= adj_file <= 7:
+            mask |= chess.BB_FILES[adj_file]
+    return mask
+
+
+def _passed_pawn_mask(square: int, color: bool) -> int:
+    """Squares on the pawn's file and adjacent files in front of it"""
+    file = chess.square_file(square)
+    rank = chess.square_rank(square)
+    ranks_ahead = range(rank + 1, 8) if color else range(0, rank)
+    front = 0
+    for check_rank in ranks_ahead:
+        front |= chess.BB_RANKS[check_rank]
+    return front & (chess.BB_FILES[file] | _adjacent_files_mask(file))
+
+
+def history_since_reset(board: chess.Board) -> Optional[Tuple[str, list]]:
+    """The FEN at the last irreversible move and the UCI moves played since, or None.
+
+    Searches in other processes get this along with the FEN, so that ``board_from_history``
+    gives them the move stack needed to see repetitions of positions before the search.
+    """
+    plies = min(board.halfmove_clock, len(board.move_stack))
+    if not plies:
+        return None
+    start = board.copy(stack=plies)
+    moves = [start.pop().uci() for _ in range(plies)]
+    return start.fen(), moves[::-1]
+
+
+def board_from_history(fen: str, history: Optional[Tuple[str, list]] = None) -> chess.Board:
+    """The board at ``fen``, with the moves of ``history`` on its stack when they lead to it"""
+    if history:
+        try:
+            board = chess.Board(history[0])
+            for uci in history[1]:
+                board.push_uci(uci)
+        except ValueError:
+            board = None
+        if board is not None and board.fen() == fen:
+            return board
+    return chess.Board(fen)
 
 
 class ChessAI:
@@ -84,80 +331,702 @@ class ChessAI:
         20, 30, 10, 0, 0, 10, 30, 20
     ]
 
+    # Mobility: score per available move; EXACT_MOBILITY switches to full legal move generation
+    MOBILITY_WEIGHT = 10
+    EXACT_MOBILITY = False
+
+    # Precomputed evaluation masks
+    CASTLED_KING_SQUARES = {
+        chess.WHITE: (chess.G1, chess.C1),
+        chess.BLACK: (chess.G8, chess.C8)
+    }
+    ADJACENT_FILES_MASKS = [_adjacent_files_mask(file) for file in range(8)]
+    PASSED_PAWN_MASKS = {
+        color: [_passed_pawn_mask(square, color) for square in chess.SQUARES]
+        for color in chess.COLORS
+    }
+
+    # Move ordering scores (history scores stay below KILLER_SCORE in practice)
+    HASH_MOVE_SCORE = 10_000_000
+    CAPTURE_SCORE = 1_000_000
+    KILLER_SCORE = 900_000
+    MVV_LVA_VICTIM = {
+        chess.PAWN: 10,
+        chess.KNIGHT: 20,
+        chess.BISHOP: 30,
+        chess.ROOK: 40,
+        chess.QUEEN: 50,
+        chess.KING: 60
+    }
+
+    # Quiescence search: margin added to a capture's material gain before delta pruning
+    DELTA_MARGIN = 200
+
+    # Opening book consulted before searching (file from OPENING_BOOK_PATH, opened on first use)
+    book = OpeningBook()
+
+    # Iterative deepening settings
+    MAX_SEARCH_DEPTH = 64
+    ASPIRATION_WINDOW = 50
+    DEFAULT_TIME_LIMIT = int(os.getenv("AI_THINK_TIME", 2000)) / 1000
+
+    # Difficulty levels selectable per game (AI_DIFFICULTY is the default)
+    LEVELS = {
+        level.name: level for level in (
+            AILevel("beginner", depth=2, time_limit=0.2, node_limit=2_000, noise=150),
+            AILevel("easy", depth=3, time_limit=0.5, node_limit=10_000, noise=60),
+            AILevel("medium", depth=5, time_limit=DEFAULT_TIME_LIMIT, node_limit=50_000, noise=15),
+            AILevel("hard", depth=8, time_limit=4.0, node_limit=200_000),
+            AILevel("expert", depth=MAX_SEARCH_DEPTH, time_limit=8.0, node_limit=1_000_000),
+        )
+    }
+    DEFAULT_LEVEL = os.getenv("AI_DIFFICULTY", "medium")
+
+    # Search algorithm: "negamax" (PVS with null-move pruning, LMR and check extensions) or "minimax"
+    SEARCH_ALGORITHMS = ("minimax", "negamax")
+    SEARCH_ALGORITHM = os.getenv("AI_SEARCH_ALGORITHM", "negamax")
+
+    # Null-move pruning: depth reduction of the null-move search and the depth it starts at
+    NULL_MOVE_REDUCTION = 3
+    NULL_MOVE_MIN_DEPTH = 3
+
+    # Late-move reductions: quiet moves after the first LMR_MIN_MOVES are searched shallower,
+    # by log(depth) * log(move index) / 2 plies, and re-searched if they beat alpha
+    LMR_MIN_DEPTH = 3
+    LMR_MIN_MOVES = 2
+
+    # Futility pruning near the leaves: margin per remaining ply for cutting on the static score
+    FUTILITY_MARGIN = 100
+    FUTILITY_MAX_DEPTH = 3
+
     @classmethod
-    def get_best_move(cls, board: chess.Board, depth: int = 3) -> Optional[Tuple[str, str]]:
-        """Get the best move for the current position"""
-        best_move = None
-        best_value = float('-inf')
+    def get_level(cls, name: Optional[str] = None) -> AILevel:
+        """Return a difficulty level by name, falling back to the default level"""
+        return cls.LEVELS.get(name) or cls.LEVELS.get(cls.DEFAULT_LEVEL) or cls.LEVELS["medium"]
+
+    @classmethod
+    def get_best_move(cls, board: chess.Board, depth: Optional[int] = None,
+                      table: Optional[TranspositionTable] = None,
+                      time_limit: Optional[float] = None,
+                      node_limit: Optional[int] = None,
+                      parallel=None,
+                      level: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """Get the best move for the current position.
 
-        # Get all legal moves
-        legal_moves = list(board.legal_moves)
+        Pass the same ``table`` for every move of a game so later searches reuse earlier work.
+        With ``time_limit`` (seconds) or ``node_limit`` the search deepens until the budget runs out.
+        ``parallel`` is a ``parallel_search.ParallelSearch`` to split the root over several processes;
+        its workers cannot use ``table``, so the two cannot be combined.
+        ``level`` names a difficulty level whose limits and noise fill in the unset arguments.
+        """
+        noise = 0
+        if level is not None:
+            ai_level = cls.get_level(level)
+            depth = depth or ai_level.depth
+            time_limit = time_limit or ai_level.time_limit
+            node_limit = node_limit or ai_level.node_limit
+            noise = ai_level.noise
 
-        if not legal_moves:
+        if parallel is not None:
+            if table is not None:
+                raise ValueError("A transposition table cannot be used with a parallel search")
+            result = parallel.search(board, depth, time_limit, node_limit=node_limit, noise=noise)
+        else:
+            result = cls.search(board, depth, table, time_limit, node_limit, noise=noise)
+        if result.move is None:
             return None
+        return (chess.square_name(result.move.from_square), chess.square_name(result.move.to_square))
 
-        # Add some randomness to the opening
-        if len(board.move_stack) < 4:
-            random.shuffle(legal_moves)
+    @classmethod
+    def search(cls, board: chess.Board, depth: Optional[int] = None,
+               table: Optional[TranspositionTable] = None,
+               time_limit: Optional[float] = None,
+               node_limit: Optional[int] = None,
+               stop_check: Optional[Callable[[], bool]] = None,
+               root_moves: Optional[list] = None,
+               deterministic: bool = False,
+               use_book: bool = True,
+               cache: Optional[SearchCache] = None,
+               algorithm: Optional[str] = None,
+               noise: int = 0) -> "SearchResult":
+        """Iterative deepening search returning the best move of the last completed iteration.
 
-        # Evaluate each move
-        for move in legal_moves:
-            board.push(move)
-            value = cls.minimax(board, depth - 1, float('-inf'), float('inf'), False)
+        ``stop_check`` is polled during the search; returning True aborts it early.
+        ``root_moves`` restricts the search to those moves, searched in the given order.
+        ``deterministic`` runs a single table-free iteration at ``depth`` without opening
+        randomness, so the result only depends on the position and the root move order.
+        ``use_book`` answers from the opening book, without searching, when the position is in it.
+        ``cache`` is a persistent ``SearchCache``: a stored result deep enough is returned as is,
+        a shallower one lets iterative deepening resume above its depth, and new deeper results
+        are written back.
+        ``algorithm`` picks "negamax" or "minimax" (default ``AI_SEARCH_ALGORITHM``); the two store
+        differently signed scores, so a ``table`` must only be shared by searches of one algorithm.
+        ``noise`` adds up to that many centipawns of random noise to every evaluation; noisy
+        searches share ``cache`` only with searches of the same noise (see ``SearchCache.noisy_key``).
+        """
+        algorithm = algorithm or cls.SEARCH_ALGORITHM
+        if algorithm not in cls.SEARCH_ALGORITHMS:
+            raise ValueError(f"Unknown search algorithm: {algorithm}")
+        search_root = cls._negamax_root if algorithm == "negamax" else cls._search_root
+
+        if depth is None:
+            depth = cls.MAX_SEARCH_DEPTH if (time_limit or node_limit) else 3
+        if deterministic:
+            table = None
+        elif table is None:
+            table = TranspositionTable()
+        if table is not None:
+            table.new_search()
+
+        context = SearchContext(table, time_limit, node_limit, len(board.move_stack), stop_check, noise)
+        context.attach(board)
+        result = SearchResult()
+        root_key = None
+        cache_key = None
+        cached = None
+
+        if root_moves is None:
+            # Answer straight from the opening book when the position is in it
+            if use_book and not deterministic:
+                book_move = cls.book.get_move(board)
+                if book_move is not None:
+                    result.move = book_move
+                    result.from_book = True
+                    return result
+
+            # Get all legal moves
+            root_moves = list(board.legal_moves)
+
+            if not root_moves:
+                return result
+
+            # Add some randomness to the opening (ply() also works for boards rebuilt from a FEN)
+            if board.ply() < 4 and not deterministic:
+                random.shuffle(root_moves)
+
+            root_key = zobrist_key(board)
+            entry = table.probe(root_key) if table is not None else None
+            root_moves = cls.order_moves(board, root_moves, entry.move if entry else None, context)
+
+            # Results other searches (or earlier runs) stored for this position
+            if cache is not None and not deterministic:
+                cache_key = SearchCache.noisy_key(root_key, noise)
+                cached = cache.get(cache_key)
+                if cached is not None and cached.move not in root_moves:
+                    # Stale or colliding entry: search as if there were none
+                    cached = None
+                if cached is not None:
+                    result.move = cached.move
+                    result.score = cached.score
+                    result.depth = cached.depth
+                    result.from_cache = True
+                    if cached.depth >= depth:
+                        result.ponder_move = cls._ponder_move(board, result.move, table)
+                        return result
+                    context.completed_depth = cached.depth
+                    root_moves.remove(cached.move)
+                    root_moves.insert(0, cached.move)
+        else:
+            root_moves = list(root_moves)
+            if not root_moves:
+                return result
+
+        if cached is None:
+            result.move = root_moves[0]
+        root_ply = len(board.move_stack)
+        maximizing = board.turn == chess.WHITE
+        first_depth = depth if deterministic else result.depth + 1
+
+        for current_depth in range(first_depth, depth + 1):
+            context.iteration_depth = current_depth
+            try:
+                if result.depth == 0:
+                    move, score = search_root(board, root_moves, current_depth, float('-inf'),
+                                              float('inf'), maximizing, context)
+                else:
+                    # Aspiration window around the previous score, widened on failure
+                    alpha = result.score - cls.ASPIRATION_WINDOW
+                    beta = result.score + cls.ASPIRATION_WINDOW
+                    move, score = search_root(board, root_moves, current_depth, alpha, beta,
+                                              maximizing, context)
+                    if score <= alpha or score >= beta:
+                        move, score = search_root(board, root_moves, current_depth, float('-inf'),
+                                                  float('inf'), maximizing, context)
+            except SearchAborted:
+                while len(board.move_stack) > root_ply:
+                    board.pop()
+                break
+
+            result.move = move
+            result.score = score
+            result.depth = current_depth
+            result.from_cache = False
+            context.completed_depth = current_depth
+
+            # Search the previous best move first on the next iteration
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+
+            if abs(score) >= cls.PIECE_VALUES[chess.KING]:
+                break
+
+        # Keep deep results for later searches of the same position
+        if cache_key is not None and not result.from_cache and (cached is None or result.depth > cached.depth):
+            cache.put(cache_key, result.depth, result.score, result.move)
+
+        result.nodes = context.nodes
+        result.qnodes = context.qnodes
+        result.time_ms = context.elapsed_ms()
+        result.first_move_cutoff_rate = context.first_move_cutoff_rate()
+        result.ponder_move = cls._ponder_move(board, result.move, table)
+        return result
+
+    @classmethod
+    def _ponder_move(cls, board: chess.Board, move: Optional[chess.Move],
+                     table: Optional[TranspositionTable]) -> Optional[chess.Move]:
+        """The table's best reply to ``move``, if it has a legal one"""
+        if move is None or table is None:
+            return None
+        board.push(move)
+        try:
+            entry = table.probe(zobrist_key(board))
+            if entry is not None and entry.move is not None and board.is_legal(entry.move):
+                return entry.move
+            return None
+        finally:
             board.pop()
 
-            if value > best_value:
+    @classmethod
+    def _search_root(cls, board: chess.Board, root_moves: list, depth: int, alpha: float, beta: float,
+                     maximizing: bool, context: "SearchContext") -> Tuple[chess.Move, float]:
+        """Search every root move inside the (alpha, beta) window"""
+        best_move = root_moves[0]
+        best_value = float('-inf') if maximizing else float('inf')
+
+        for move in root_moves:
+            context.push(board, move)
+            value = cls.minimax(board, depth - 1, alpha, beta, not maximizing, context)
+            context.pop(board)
+
+            if maximizing and value > best_value:
                 best_value = value
                 best_move = move
+                alpha = max(alpha, value)
+            elif not maximizing and value < best_value:
+                best_value = value
+                best_move = move
+                beta = min(beta, value)
 
-        if best_move:
-            return (chess.square_name(best_move.from_square), chess.square_name(best_move.to_square))
+            if beta <= alpha:
+                break
 
-        # Fallback to random move
-        move = random.choice(legal_moves)
-        return (chess.square_name(move.from_square), chess.square_name(move.to_square))
+        return best_move, best_value
 
     @classmethod
-    def minimax(cls, board: chess.Board, depth: int, alpha: float, beta: float, maximizing_player: bool) -> float:
-        """Minimax algorithm with alpha-beta pruning"""
-        if depth == 0 or board.is_game_over():
-            return cls.evaluate_position(board)
+    def minimax(cls, board: chess.Board, depth: int, alpha: float, beta: float, maximizing_player: bool,
+                context: Optional[SearchContext] = None) -> float:
+        """Minimax algorithm with alpha-beta pruning, move ordering and an optional transposition table"""
+        if context is None:
+            context = SearchContext(root_ply=len(board.move_stack))
+            context.attach(board)
+        context.count_node()
+        table = context.table
+
+        if context.is_repetition(board):
+            return 0
+
+        if depth == 0:
+            return cls.quiescence(board, alpha, beta, maximizing_player, context)
+
+        key = None
+        hash_move = None
+        if table is not None:
+            key = context.key
+            entry = table.probe(key)
+            if entry is not None:
+                hash_move = entry.move
+                if entry.depth >= depth:
+                    if entry.bound == EXACT:
+                        return entry.score
+                    if entry.bound == LOWER_BOUND:
+                        alpha = max(alpha, entry.score)
+                    elif entry.bound == UPPER_BOUND:
+                        beta = min(beta, entry.score)
+                    if beta <= alpha:
+                        return entry.score
+
+        # Checkmate and stalemate show up as an empty move list
+        moves = list(board.legal_moves)
+        if not moves:
+            return context.terminal_score(board)
+        if board.halfmove_clock >= 100 or board.is_insufficient_material():
+            return 0
+
+        alpha_orig, beta_orig = alpha, beta
+        best_move = None
+        moves = cls.order_moves(board, moves, hash_move, context)
 
         if maximizing_player:
             max_eval = float('-inf')
-            for move in board.legal_moves:
-                board.push(move)
-                eval_score = cls.minimax(board, depth - 1, alpha, beta, False)
-                board.pop()
-                max_eval = max(max_eval, eval_score)
+            for index, move in enumerate(moves):
+                context.push(board, move)
+                eval_score = cls.minimax(board, depth - 1, alpha, beta, False, context)
+                context.pop(board)
+                if eval_score > max_eval:
+                    max_eval = eval_score
+                    best_move = move
                 alpha = max(alpha, eval_score)
                 if beta <= alpha:
+                    context.record_cutoff(board, move, index, depth)
                     break
-            return max_eval
+            best_eval = max_eval
         else:
             min_eval = float('inf')
-            for move in board.legal_moves:
-                board.push(move)
-                eval_score = cls.minimax(board, depth - 1, alpha, beta, True)
-                board.pop()
-                min_eval = min(min_eval, eval_score)
+            for index, move in enumerate(moves):
+                context.push(board, move)
+                eval_score = cls.minimax(board, depth - 1, alpha, beta, True, context)
+                context.pop(board)
+                if eval_score < min_eval:
+                    min_eval = eval_score
+                    best_move = move
                 beta = min(beta, eval_score)
                 if beta <= alpha:
+                    context.record_cutoff(board, move, index, depth)
                     break
-            return min_eval
+            best_eval = min_eval
+
+        if table is not None:
+            if best_eval <= alpha_orig:
+                bound = UPPER_BOUND
+            elif best_eval >= beta_orig:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            table.store(key, depth, best_eval, bound, best_move)
+
+        return best_eval
 
     @classmethod
-    def evaluate_position(cls, board: chess.Board) -> float:
-        """Evaluate the current position"""
-        if board.is_checkmate():
-            return -20000 if board.turn else 20000
+    def _negamax_root(cls, board: chess.Board, root_moves: list, depth: int, alpha: float, beta: float,
+                      maximizing: bool, context: "SearchContext") -> Tuple[chess.Move, float]:
+        """Principal-variation search over the root moves; window and score are White-relative"""
+        sign = 1 if maximizing else -1
+        if not maximizing:
+            alpha, beta = -beta, -alpha
 
-        if board.is_stalemate() or board.is_insufficient_material():
+        best_move = root_moves[0]
+        best_value = float('-inf')
+
+        for index, move in enumerate(root_moves):
+            context.push(board, move)
+            if index == 0:
+                value = -cls.negamax(board, depth - 1, -beta, -alpha, context)
+            else:
+                # Prove the move is no better than the current best with a null window
+                value = -cls.negamax(board, depth - 1, -alpha - 1, -alpha, context)
+                if alpha < value < beta:
+                    value = -cls.negamax(board, depth - 1, -beta, -alpha, context)
+            context.pop(board)
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        return best_move, sign * best_value
+
+    @classmethod
+    def negamax(cls, board: chess.Board, depth: int, alpha: float, beta: float,
+                context: Optional[SearchContext] = None, allow_null: bool = True) -> float:
+        """Negamax alpha-beta with PVS, null-move pruning, late-move reductions and check extensions.
+
+        Scores are relative to the side to move.
+        """
+        if context is None:
+            context = SearchContext(root_ply=len(board.move_stack))
+            context.attach(board)
+        context.count_node()
+        table = context.table
+        sign = 1 if board.turn == chess.WHITE else -1
+
+        if context.is_repetition(board):
+            return 0
+
+        # Check extension, capped so perpetual-check lines cannot run away
+        in_check = board.is_check()
+        ply = len(board.move_stack) - context.root_ply
+        if in_check and ply < 2 * context.iteration_depth:
+            depth += 1
+
+        if depth <= 0:
+            if sign > 0:
+                return cls.quiescence(board, alpha, beta, True, context, True)
+            return -cls.quiescence(board, -beta, -alpha, False, context, True)
+
+        key = None
+        hash_move = None
+        if table is not None:
+            key = context.key
+            entry = table.probe(key)
+            if entry is not None:
+                hash_move = entry.move
+                if entry.depth >= depth:
+                    if entry.bound == EXACT:
+                        return entry.score
+                    if entry.bound == LOWER_BOUND:
+                        alpha = max(alpha, entry.score)
+                    elif entry.bound == UPPER_BOUND:
+                        beta = min(beta, entry.score)
+                    if alpha >= beta:
+                        return entry.score
+
+        # Checkmate and stalemate show up as an empty move list
+        moves = list(board.legal_moves)
+        if not moves:
+            return sign * context.terminal_score(board)
+        if board.halfmove_clock >= 100 or board.is_insufficient_material():
+            return 0
+
+        # Pruning on the static score, only in null-window nodes out of check
+        pv_node = beta - alpha > 1
+        static_eval = None
+        if not pv_node and not in_check:
+            static_eval = sign * context.evaluate(board)
+
+            # Reverse futility: far enough above beta that a shallow search will not drop below it
+            if depth <= cls.FUTILITY_MAX_DEPTH and static_eval - cls.FUTILITY_MARGIN * depth >= beta \
+                    and abs(beta) < cls.PIECE_VALUES[chess.KING]:
+                return static_eval
+
+            # Null-move pruning: if passing still fails high the position is good enough to cut.
+            # Skipped without pieces, where zugzwang makes passing unsound.
+            if allow_null and depth >= cls.NULL_MOVE_MIN_DEPTH and static_eval >= beta \
+                    and board.occupied_co[board.turn] & ~(board.pawns | board.kings):
+                context.push(board, chess.Move.null())
+                value = -cls.negamax(board, depth - 1 - cls.NULL_MOVE_REDUCTION, -beta, -beta + 1, context, False)
+                context.pop(board)
+                if value >= beta:
+                    # Do not trust a mate score found by passing
+                    return beta if value >= cls.PIECE_VALUES[chess.KING] else value
+
+        # Futility: quiet moves cannot lift a score this far below alpha in the remaining plies
+        futile = static_eval is not None and depth <= cls.FUTILITY_MAX_DEPTH and \
+            static_eval + cls.FUTILITY_MARGIN * depth <= alpha
+
+        alpha_orig = alpha
+        best_value = float('-inf')
+        best_move = None
+        moves = cls.order_moves(board, moves, hash_move, context)
+        killers = context.killers.get(ply, ())
+
+        for index, move in enumerate(moves):
+            quiet = not move.promotion and not board.is_capture(move) and move not in killers
+            if futile and quiet and index > 0 and not board.gives_check(move):
+                continue
+            context.push(board, move)
+            if index == 0:
+                value = -cls.negamax(board, depth - 1, -beta, -alpha, context)
+            else:
+                # Late quiet moves are searched shallower; checks and evasions are never reduced
+                reduction = 0
+                if quiet and not in_check and depth >= cls.LMR_MIN_DEPTH and index >= cls.LMR_MIN_MOVES \
+                        and not board.is_check():
+                    reduction = int(0.5 + math.log(depth) * math.log(index) / 2)
+
+                value = -cls.negamax(board, depth - 1 - reduction, -alpha - 1, -alpha, context)
+                if reduction and value > alpha:
+                    value = -cls.negamax(board, depth - 1, -alpha - 1, -alpha, context)
+                if alpha < value < beta:
+                    value = -cls.negamax(board, depth - 1, -beta, -alpha, context)
+            context.pop(board)
+
+            if value > best_value:
+                best_value = value
+                best_move = move
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                context.record_cutoff(board, move, index, depth)
+                break
+
+        if table is not None:
+            if best_value <= alpha_orig:
+                bound = UPPER_BOUND
+            elif best_value >= beta:
+                bound = LOWER_BOUND
+            else:
+                bound = EXACT
+            table.store(key, depth, best_value, bound, best_move)
+
+        return best_value
+
+    @classmethod
+    def quiescence(cls, board: chess.Board, alpha: float, beta: float, maximizing_player: bool,
+                   context: SearchContext, prune_losing: bool = False) -> float:
+        """Capture-only search with stand-pat and delta pruning to settle tactics at the leaves.
+
+        ``prune_losing`` also skips captures of a cheaper piece on a defended square.
+        """
+        context.count_qnode()
+
+        # Stopping at the first legal move keeps this much cheaper than a full generation
+        if not any(board.generate_legal_moves()):
+            return context.terminal_score(board)
+        stand_pat = context.evaluate(board)
+
+        if maximizing_player:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        best_eval = stand_pat
+        captures = cls.order_moves(board, list(board.generate_legal_captures()), None, context)
+
+        for move in captures:
+            # Delta pruning: skip captures that cannot lift the score back into the window
+            if not move.promotion:
+                victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+                gain = cls.PIECE_VALUES[victim] + cls.DELTA_MARGIN
+                if maximizing_player and stand_pat + gain <= alpha:
+                    continue
+                if not maximizing_player and stand_pat - gain >= beta:
+                    continue
+
+                if prune_losing and cls.PIECE_VALUES[victim] < \
+                        cls.PIECE_VALUES[board.piece_type_at(move.from_square)] and \
+                        board.is_attacked_by(not board.turn, move.to_square):
+                    continue
+
+            context.push(board, move)
+            eval_score = cls.quiescence(board, alpha, beta, not maximizing_player, context, prune_losing)
+            context.pop(board)
+
+            if maximizing_player:
+                best_eval = max(best_eval, eval_score)
+                alpha = max(alpha, eval_score)
+            else:
+                best_eval = min(best_eval, eval_score)
+                beta = min(beta, eval_score)
+            if beta <= alpha:
+                break
+
+        return best_eval
+
+    @classmethod
+    def order_moves(cls, board: chess.Board, moves: list, hash_move: Optional[chess.Move],
+                    context: SearchContext) -> list:
+        """Order moves: hash move, captures by MVV-LVA, killers, then quiet moves by history score"""
+        killers = context.killers.get(len(board.move_stack) - context.root_ply, ())
+        history = context.history
+        turn = board.turn
+
+        def score(move):
+            if move == hash_move:
+                return cls.HASH_MOVE_SCORE
+            if board.is_capture(move):
+                if board.is_en_passant(move):
+                    victim = chess.PAWN
+                else:
+                    victim = board.piece_type_at(move.to_square)
+                attacker = board.piece_type_at(move.from_square)
+                return cls.CAPTURE_SCORE + cls.MVV_LVA_VICTIM[victim] - attacker
+            if move.promotion:
+                return cls.CAPTURE_SCORE + move.promotion
+            if move in killers:
+                return cls.KILLER_SCORE - killers.index(move)
+            return history.get((turn, move.from_square, move.to_square), 0)
+
+        moves.sort(key=score, reverse=True)
+        return moves
+
+    @classmethod
+    def evaluate_position(cls, board: chess.Board, material: Optional[float] = None,
+                          exact_mobility: Optional[bool] = None, check_terminal: bool = True) -> float:
+        """Evaluate the current position.
+
+        ``material`` is the material plus piece-square score if the caller already tracks it.
+        ``exact_mobility`` counts legal moves for both sides instead of the attack-set estimate.
+        ``check_terminal=False`` skips the checkmate/stalemate tests for callers that already
+        know the side to move has a legal move.
+        """
+        if check_terminal:
+            if board.is_checkmate():
+                return -20000 if board.turn else 20000
+            if board.is_stalemate():
+                return 0
+
+        if board.is_insufficient_material():
             return 0
 
+        if material is None:
+            material = cls.evaluate_material(board)
+        evaluation = material
+
+        # Mobility evaluation
+        if exact_mobility is None:
+            exact_mobility = cls.EXACT_MOBILITY
+        if exact_mobility:
+            evaluation += cls.evaluate_legal_mobility(board) * cls.MOBILITY_WEIGHT
+        else:
+            evaluation += (cls.evaluate_mobility(board, chess.WHITE) -
+                           cls.evaluate_mobility(board, chess.BLACK)) * cls.MOBILITY_WEIGHT
+
+        # King safety evaluation
+        evaluation += cls.evaluate_king_safety(board, chess.WHITE)
+        evaluation -= cls.evaluate_king_safety(board, chess.BLACK)
+
+        # Pawn structure evaluation
+        evaluation += cls.evaluate_pawn_structure(board, chess.WHITE)
+        evaluation -= cls.evaluate_pawn_structure(board, chess.BLACK)
+
+        return evaluation
+
+    @classmethod
+    def evaluate_mobility(cls, board: chess.Board, color: bool) -> int:
+        """Pseudo-legal mobility estimate from attack-set popcounts"""
+        own = board.occupied_co[color]
+        mobility = 0
+
+        # Pieces: attacked squares not occupied by own pieces
+        for square in chess.scan_forward(own & ~board.pawns):
+            mobility += chess.popcount(board.attacks_mask(square) & ~own)
+
+        # Pawns: pushes onto empty squares plus captures of enemy pieces
+        pawns = board.pawns & own
+        empty = ~board.occupied & chess.BB_ALL
+        if color == chess.WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & chess.BB_RANK_3) << 8) & empty
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & chess.BB_RANK_6) >> 8) & empty
+        mobility += chess.popcount(single) + chess.popcount(double)
+
+        enemy = board.occupied_co[not color]
+        for square in chess.scan_forward(pawns):
+            mobility += chess.popcount(chess.BB_PAWN_ATTACKS[color][square] & enemy)
+
+        return mobility
+
+    @classmethod
+    def evaluate_legal_mobility(cls, board: chess.Board) -> int:
+        """White legal move count minus Black's, using a null move to count the side not to move"""
+        moves = len(list(board.legal_moves))
+        board.push(chess.Move.null())
+        other_moves = len(list(board.legal_moves))
+        board.pop()
+        return moves - other_moves if board.turn == chess.WHITE else other_moves - moves
+
+    @classmethod
+    def evaluate_material(cls, board: chess.Board) -> float:
+        """Material plus piece-square score from a full board scan"""
         evaluation = 0
 
-        # Material evaluation
         for square in chess.SQUARES:
             piece = board.piece_at(square)
             if piece:
@@ -170,20 +1039,6 @@ class ChessAI:
                 # Positional evaluation
                 evaluation += cls.get_position_value(piece, square)
 
-        # Mobility evaluation (number of legal moves)
-        evaluation += len(list(board.legal_moves)) * 10
-        board.push(chess.Move.null())
-        evaluation -= len(list(board.legal_moves)) * 10
-        board.pop()
-
-        # King safety evaluation
-        evaluation += cls.evaluate_king_safety(board, chess.WHITE)
-        evaluation -= cls.evaluate_king_safety(board, chess.BLACK)
-
-        # Pawn structure evaluation
-        evaluation += cls.evaluate_pawn_structure(board, chess.WHITE)
-        evaluation -= cls.evaluate_pawn_structure(board, chess.BLACK)
-
         return evaluation
 
     @classmethod
@@ -223,21 +1078,11 @@ class ChessAI:
         safety_score = 0
 
         # Check if king is castled
-        if color == chess.WHITE:
-            if king_square in [chess.G1, chess.C1]:
-                safety_score += 30
-        else:
-            if king_square in [chess.G8, chess.C8]:
-                safety_score += 30
-
-        # Penalty for exposed king
-        attackers = 0
-        for attacker_square in chess.SQUARES:
-            piece = board.piece_at(attacker_square)
-            if piece and piece.color != color:
-                if board.is_attacked_by(piece.color, king_square):
-                    attackers += 1
+        if king_square in cls.CASTLED_KING_SQUARES[color]:
+            safety_score += 30
 
+        # Penalty for each enemy piece attacking the king
+        attackers = chess.popcount(board.attackers_mask(not color, king_square))
         safety_score -= attackers * 20
 
         return safety_score
@@ -246,37 +1091,22 @@ class ChessAI:
     def evaluate_pawn_structure(cls, board: chess.Board, color: bool) -> float:
         """Evaluate pawn structure"""
         score = 0
-        pawns = board.pieces(chess.PAWN, color)
+        pawns = board.pieces_mask(chess.PAWN, color)
+        enemy_pawns = board.pieces_mask(chess.PAWN, not color)
 
         # Doubled pawns penalty
-        files = {}
-        for pawn in pawns:
-            file = chess.square_file(pawn)
-            files[file] = files.get(file, 0) + 1
-
-        for count in files.values():
+        for file_mask in chess.BB_FILES:
+            count = chess.popcount(pawns & file_mask)
             if count > 1:
                 score -= (count - 1) * 20
 
-        # Isolated pawns penalty
-        for pawn in pawns:
-            file = chess.square_file(pawn)
-            is_isolated = True
-
-            # Check adjacent files
-            for adj_file in [file - 1, file + 1]:
-                if 0 <= adj_file <= 7:
-                    for adj_pawn in pawns:
-                        if chess.square_file(adj_pawn) == adj_file:
-                            is_isolated = False
-                            break
-
-            if is_isolated:
+        for pawn in chess.scan_forward(pawns):
+            # Isolated pawns penalty
+            if not pawns & cls.ADJACENT_FILES_MASKS[chess.square_file(pawn)]:
                 score -= 25
 
-        # Passed pawns bonus
-        for pawn in pawns:
-            if cls.is_passed_pawn(board, pawn, color):
+            # Passed pawns bonus
+            if not enemy_pawns & cls.PASSED_PAWN_MASKS[color][pawn]:
                 score += 50
 
         return score
@@ -284,20 +1114,68 @@ class ChessAI:
     @classmethod
     def is_passed_pawn(cls, board: chess.Board, pawn_square: int, color: bool) -> bool:
         """Check if a pawn is a passed pawn"""
-        file = chess.square_file(pawn_square)
-        rank = chess.square_rank(pawn_square)
-
-        # Check files in front of the pawn
-        start_rank = rank + 1 if color else rank - 1
-        end_rank = 8 if color else -1
-        step = 1 if color else -1
-
-        for check_rank in range(start_rank, end_rank, step):
-            for check_file in [file - 1, file, file + 1]:
-                if 0 <= check_file <= 7:
-                    square = chess.square(check_file, check_rank)
-                    piece = board.piece_at(square)
-                    if piece and piece.piece_type == chess.PAWN and piece.color != color:
-                        return False
-
-        return True
\ No newline at end of file
+        return not board.pieces_mask(chess.PAWN, not color) & cls.PASSED_PAWN_MASKS[color][pawn_square]
+
+
+class IncrementalEvaluator:
+    """Material and piece-square score maintained move by move.
+
+    ``push``/``pop`` wrap ``board.push``/``board.pop`` and apply the score delta of the move,
+    so a search can read ``score`` at every leaf instead of rescanning the board.
+    """
+
+    # Signed material + PST value per [color][piece_type][square], white positive
+    VALUES = {
+        color: {
+            piece_type: [
+                (ChessAI.PIECE_VALUES[piece_type] if color else -ChessAI.PIECE_VALUES[piece_type]) +
+                ChessAI.get_position_value(chess.Piece(piece_type, color), square)
+                for square in chess.SQUARES
+            ]
+            for piece_type in chess.PIECE_TYPES
+        }
+        for color in chess.COLORS
+    }
+
+    def __init__(self, board: chess.Board):
+        self.score = ChessAI.evaluate_material(board)
+        self.stack = []
+
+    def push(self, board: chess.Board, move: chess.Move):
+        self.stack.append(self.score)
+        self.score += self.move_delta(board, move)
+        board.push(move)
+
+    def pop(self, board: chess.Board):
+        board.pop()
+        self.score = self.stack.pop()
+
+    @classmethod
+    def move_delta(cls, board: chess.Board, move: chess.Move) -> float:
+        """Score change of a move, computed before it is pushed"""
+        if not move:
+            return 0
+
+        color = board.turn
+        values = cls.VALUES
+        piece_type = board.piece_type_at(move.from_square)
+        from_sq, to_sq = move.from_square, move.to_square
+
+        delta = values[color][move.promotion or piece_type][to_sq] - values[color][piece_type][from_sq]
+
+        if board.is_castling(move):
+            rank = chess.square_rank(from_sq)
+            if chess.square_file(to_sq) > chess.square_file(from_sq):
+                rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+            else:
+                rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+            delta += values[color][chess.ROOK][rook_to] - values[color][chess.ROOK][rook_from]
+        elif board.is_en_passant(move):
+            captured_sq = to_sq - 8 if color else to_sq + 8
+            delta -= values[not color][chess.PAWN][captured_sq]
+        else:
+            captured = board.piece_type_at(to_sq)
+            if captured:
+                delta -= values[not color][captured][to_sq]
+
+        return delta
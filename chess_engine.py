@@ -1,8 +1,82 @@
 # chess_engine.py
+import json
+import logging
+from array import array
+
 import chess
 import chess.engine
-import json
 from models import Database
+from profiling import RateLimitFilter
+
+logger = logging.getLogger(__name__)
+# Move problems can repeat on every move of a busy game; keep them from flooding the log
+logger.addFilter(RateLimitFilter())
+
+
+def pack_move(move):
+    """Pack a move into 16 bits: from square, to square and promotion piece type"""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(packed):
+    """Inverse of pack_move"""
+    return chess.Move(packed & 0x3F, packed >> 6 & 0x3F, promotion=(packed >> 12) or None)
+
+
+def materialize_history(moves, start=0, end=None, start_fen=chess.STARTING_FEN):
+    """Per-ply dicts (from, to, promotion, san, fen) for ``moves[start:end]`` of packed moves.
+
+    The earlier moves are replayed from ``start_fen``, but SAN and FEN strings are only built
+    for the requested range.
+    """
+    end = len(moves) if end is None else min(end, len(moves))
+    board = chess.Board(start_fen)
+    history = []
+    for ply in range(end):
+        move = unpack_move(moves[ply])
+        if ply < start:
+            board.push(move)
+            continue
+        san = board.san(move)
+        board.push(move)
+        history.append({
+            'from': chess.square_name(move.from_square),
+            'to': chess.square_name(move.to_square),
+            'promotion': move.promotion,
+            'san': san,
+            'fen': board.fen()
+        })
+    return history
+
+
+def start_position(game_data, has_moves):
+    """FEN the stored moves of a game (a ``games`` row) are played from.
+
+    Games that had their position saved but not their moves (older games whose move history
+    could not be migrated) continue from that position.
+    """
+    if game_data.get('start_fen'):
+        return game_data['start_fen']
+    if not has_moves and game_data.get('fen_position'):
+        return game_data['fen_position']
+    return chess.STARTING_FEN
+
+
+def history_to_json(moves):
+    """Packed moves in the JSON format of the old games.moves column"""
+    return json.dumps(materialize_history(moves))
+
+
+def history_from_json(text):
+    """Packed moves from the JSON format of the old games.moves column"""
+    moves = array('H')
+    for entry in json.loads(text) if text else []:
+        promotion = entry.get('promotion')
+        if isinstance(promotion, str):
+            promotion = chess.Piece.from_symbol(promotion).piece_type
+        moves.append(pack_move(chess.Move(chess.parse_square(entry['from']), chess.parse_square(entry['to']),
+                                          promotion=promotion)))
+    return moves
 
 
 class ChessGame:
@@ -14,19 +88,85 @@ class ChessGame:
 
         # Load existing game state or create new
         game_data = Database.get_game(game_id)
-        if game_data and game_data['fen_position'] and game_data[
-            'fen_position'] != "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1":
-            self.board = chess.Board(game_data['fen_position'])
-            try:
-                self.move_history = json.loads(game_data['moves']) if game_data['moves'] else []
-            except:
-                self.move_history = []
+        self.ai_level = game_data.get('ai_level') if game_data else None
+        self.board = chess.Board()
+        # Moves played from start_fen, 16 bits each (see pack_move); history dicts are built on request
+        self.start_fen = chess.STARTING_FEN
+        self.moves = array('H')
+        self.last_san = None
+        # Rows in game_moves; the next move is stored at this ply
+        self._stored_plies = 0
+        if game_data:
+            self._load_moves(game_data)
+
+        # Squares changed by the last move: {square name: piece symbol or None}
+        self.last_changes = {}
+
+        # Derived state of the current position (status, legal moves, ...), see _cached
+        self._derived = {}
+        self._derived_seq = None
+
+    def _load_moves(self, game_data):
+        """Rebuild the board and packed moves from the game's stored moves"""
+        rows = Database.get_game_moves(self.game_id)
+        self._stored_plies = rows[-1]['ply'] + 1 if rows else 0
+        self.start_fen = start_position(game_data, bool(rows))
+        self.board = chess.Board(self.start_fen)
+        if not rows:
+            if self.start_fen != chess.STARTING_FEN and not game_data.get('start_fen'):
+                # Moves stored from now on are played from this position
+                Database.set_start_fen(self.game_id, self.start_fen)
+            return
+
+        for row in rows:
+            move = chess.Move.from_uci(row['uci'])
+            if not self.board.is_legal(move):
+                logger.warning("Stored move %s at ply %s of game %s is illegal, using the stored position",
+                               row['uci'], row['ply'], self.game_id)
+                break
+            self.board.push(move)
+            self.moves.append(pack_move(move))
         else:
-            self.board = chess.Board()
-            self.move_history = []
+            return
+
+        # Replay failed: fall back to the last stored position, without a move history
+        fen_position = game_data.get('fen_position')
+        if fen_position:
+            self.start_fen = fen_position
+            self.board = chess.Board(fen_position)
+            self.moves = array('H')
+
+    @property
+    def seq(self):
+        """Sequence number of the position: the number of moves played"""
+        return len(self.moves)
+
+    def _cached(self, name, compute):
+        """Compute a piece of derived state once per position and serve every caller from it.
+
+        The cache is keyed by the sequence number and cleared by ``make_move``; callers must
+        not modify the returned values.
+        """
+        if self._derived_seq != self.seq:
+            self._derived = {}
+            self._derived_seq = self.seq
+        if name not in self._derived:
+            self._derived[name] = compute()
+        return self._derived[name]
+
+    def _legal_moves(self):
+        """Legal moves of the current position as chess.Move objects"""
+        return self._cached('legal', lambda: list(self.board.legal_moves))
+
+    def is_check(self):
+        """Whether the side to move is in check"""
+        return self._cached('check', self.board.is_check)
 
     def get_board_state(self):
         """Return current board state as a dictionary for the frontend"""
+        return self._cached('board', self._compute_board_state)
+
+    def _compute_board_state(self):
         board_state = {}
 
         for square in chess.SQUARES:
@@ -45,8 +185,11 @@ class ChessGame:
 
     def get_legal_moves(self):
         """Return all legal moves in UCI format"""
+        return self._cached('moves', self._compute_legal_moves)
+
+    def _compute_legal_moves(self):
         legal_moves = []
-        for move in self.board.legal_moves:
+        for move in self._legal_moves():
             legal_moves.append({
                 'from': chess.square_name(move.from_square),
                 'to': chess.square_name(move.to_square),
@@ -54,20 +197,64 @@ class ChessGame:
             })
         return legal_moves
 
+    def get_legal_moves_compact(self):
+        """Return all legal moves as one space-separated string of UCI moves ("e2e4 e7e8q")"""
+        return self._cached('compact', lambda: " ".join(move.uci() for move in self._legal_moves()))
+
+    def get_snapshot(self):
+        """Full game state, sent when a client connects or asks to resync"""
+        return {
+            "type": "game_state",
+            "seq": self.seq,
+            "board": self.get_board_state(),
+            "turn": self.get_current_turn(),
+            "moves": self.get_legal_moves_compact(),
+            "game_status": self.get_game_status(),
+            "is_check": self.is_check()
+        }
+
+    def get_move_delta(self):
+        """The last move as a delta against the previous position (seq is the new position's)"""
+        last = unpack_move(self.moves[-1])
+        return {
+            "type": "move_made",
+            "seq": self.seq,
+            "from": chess.square_name(last.from_square),
+            "to": chess.square_name(last.to_square),
+            "san": self.last_san,
+            "squares": self.last_changes,
+            "turn": self.get_current_turn(),
+            "moves": self.get_legal_moves_compact(),
+            "game_status": self.get_game_status(),
+            "is_check": self.is_check()
+        }
+
+    def _changed_squares(self, move):
+        """Squares whose contents change when ``move`` is played (before pushing it)"""
+        squares = [move.from_square, move.to_square]
+        if self.board.is_castling(move):
+            rank = chess.square_rank(move.from_square)
+            if self.board.is_kingside_castling(move):
+                squares += [chess.square(7, rank), chess.square(5, rank)]
+            else:
+                squares += [chess.square(0, rank), chess.square(3, rank)]
+        elif self.board.is_en_passant(move):
+            squares.append(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+        return squares
+
     def make_move(self, user_id, from_square, to_square, promotion=None):
         """Make a move on the board"""
-        # Debug logging
-        print(f"DEBUG: make_move called - user_id: {user_id}, turn: {self.board.turn}")
-        print(f"DEBUG: white_player_id: {self.white_player_id}, black_player_id: {self.black_player_id}")
-        print(f"DEBUG: Pre-move check status: {self.board.is_check()}")
+        # Debug logging (arguments are only formatted when DEBUG is enabled)
+        logger.debug("make_move game %s: user %s, white %s, black %s, turn %s",
+                     self.game_id, user_id, self.white_player_id, self.black_player_id, self.get_current_turn())
 
         # Validate it's the player's turn
         if not self.is_ai_game and user_id:
             if self.board.turn and user_id != self.white_player_id:
-                print(f"Invalid turn: White's turn but user {user_id} is not white player {self.white_player_id}")
+                logger.info("Game %s: white to move but user %s is not white", self.game_id, user_id)
                 return False
             if not self.board.turn and user_id != self.black_player_id:
-                print(f"Invalid turn: Black's turn but user {user_id} is not black player {self.black_player_id}")
+                logger.info("Game %s: black to move but user %s is not black", self.game_id, user_id)
                 return False
 
         # Create the move
@@ -87,72 +274,64 @@ class ChessGame:
 
             move = chess.Move(from_sq, to_sq, promotion=promotion)
 
-            # Validate the move is legal
-            if move not in self.board.legal_moves:
-                print(f"Illegal move: {move} not in legal moves")
-                print(f"Legal moves: {[str(m) for m in self.board.legal_moves]}")
+            # Validate the move is legal (legal moves always resolve a check)
+            if move not in self._legal_moves():
+                logger.info("Game %s: illegal move %s", self.game_id, move)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Legal moves: %s", self.get_legal_moves_compact())
                 return False
 
-            # If in check, verify the move resolves the check
-            if self.board.is_check():
-                # Temporarily make the move to check if it resolves check
-                self.board.push(move)
-                still_in_check = self.board.is_check()
-                self.board.pop()
-                if still_in_check:
-                    print(f"Move {move} does not resolve check")
-                    return False
-
             # Make the move
             san_notation = self.board.san(move)  # Get SAN before making the move
+            changed = self._changed_squares(move)
             self.board.push(move)
-            print(f"DEBUG: Post-move check status: {self.board.is_check()}")  # Check status after move
 
-            # Validate board state after move
-            if self.board.is_check() and self.board.turn != piece.color:
-                print(f"DEBUG: Opponent is in check after move {move}")
+            # Store it first, so a failed write leaves the game as it was
+            try:
+                Database.add_game_move(self.game_id, self._stored_plies, move.uci(), self.board.fen(), san_notation)
+            except Exception:
+                self.board.pop()
+                raise
+            self._stored_plies += 1
+            self._derived = {}
+            self.last_changes = {}
+            for square in changed:
+                changed_piece = self.board.piece_at(square)
+                self.last_changes[chess.square_name(square)] = changed_piece.symbol() if changed_piece else None
 
             # Store move in history
-            move_data = {
-                'from': from_square,
-                'to': to_square,
-                'promotion': promotion,
-                'san': san_notation,
-                'fen': self.board.fen()
-            }
-            self.move_history.append(move_data)
-
-            # Update database
-            Database.update_game(self.game_id, self.board.fen(), json.dumps(self.move_history))
+            self.moves.append(pack_move(move))
+            self.last_san = san_notation
 
             return True
 
         except Exception as e:
-            print(f"Error making move: {e}")
-            print(f"Current board state: {self.board.fen()}")
-            print(f"Attempted move: {from_square} to {to_square}")
+            logger.warning("Game %s: error making move %s%s in %s: %s",
+                           self.game_id, from_square, to_square, self.get_fen(), e)
             return False
 
     def get_game_status(self):
         """Check if the game has ended"""
-        if self.board.is_checkmate():
-            return "checkmate"
-        elif self.board.is_stalemate():
-            return "stalemate"
+        return self._cached('status', self._compute_game_status)
+
+    def _compute_game_status(self):
+        # Mate and stalemate from the cached legal moves instead of generating them again
+        if not self._legal_moves():
+            return "checkmate" if self.is_check() else "stalemate"
         elif self.board.is_insufficient_material():
             return "draw"
         elif self.board.is_seventyfive_moves():
             return "draw"
         elif self.board.is_fivefold_repetition():
             return "draw"
-        elif self.board.is_check():
+        elif self.is_check():
             return "check"
         else:
             return "active"
 
     def get_winner_id(self):
         """Return the winner's user ID if the game has ended"""
-        if self.board.is_checkmate():
+        if self.get_game_status() == "checkmate":
             # The player who just moved wins
             if self.board.turn:  # It's white's turn but black just checkmated
                 return self.black_player_id
@@ -162,11 +341,11 @@ class ChessGame:
 
     def get_fen(self):
         """Return the current FEN position"""
-        return self.board.fen()
+        return self._cached('fen', self.board.fen)
 
-    def get_move_history(self):
-        """Return the move history"""
-        return self.move_history
+    def get_move_history(self, start=0, end=None):
+        """Return the move history (plies ``start`` to ``end``) as dicts with SAN and FEN"""
+        return materialize_history(self.moves, start, end, self.start_fen)
 
     def get_piece_at(self, square):
         """Get piece at a specific square"""
@@ -183,17 +362,39 @@ class ChessGame:
         return self.board.is_attacked_by(by_color, chess.parse_square(square))
 
     def get_attacking_pieces(self, square):
-        """Get all pieces attacking a specific square"""
+        """Get all pieces attacking a specific square (of either color)"""
         attackers = []
         sq = chess.parse_square(square)
 
-        for attacker_square in chess.SQUARES:
-            piece = self.board.piece_at(attacker_square)
-            if piece and self.board.is_attacked_by(piece.color, sq):
+        for color in chess.COLORS:
+            for attacker_square in self.board.attackers(color, sq):
+                piece = self.board.piece_at(attacker_square)
                 attackers.append({
                     'square': chess.square_name(attacker_square),
                     'piece': piece.symbol(),
                     'color': 'white' if piece.color else 'black'
                 })
 
-        return attackers
\ No newline at end of file
+        return attackers
+
+    def get_threat_map(self):
+        """Pieces attacking each square, per color: {square: {'white': [...], 'black': [...]}}.
+
+        Only squares attacked by at least one piece are listed. For an occupied square the
+        occupant's own color are its defenders and the other color its attackers. Computed from
+        each piece's attack bitboard once per position.
+        """
+        return self._cached('threats', self._compute_threat_map)
+
+    def _compute_threat_map(self):
+        threats = {}
+        for attacker_square, piece in self.board.piece_map().items():
+            color = 'white' if piece.color else 'black'
+            attacker_name = chess.square_name(attacker_square)
+            for target in chess.scan_forward(self.board.attacks_mask(attacker_square)):
+                entry = threats.get(target)
+                if entry is None:
+                    entry = threats[target] = {'white': [], 'black': []}
+                entry[color].append(attacker_name)
+        return {chess.square_name(square): threats[square] for square in sorted(threats)}
+
@@ -0,0 +1,163 @@
+# game_manager.py
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from chess_engine import ChessGame
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class ActiveGameManager:
+    """In-memory ``ChessGame`` objects of the games being played, bounded in size.
+
+    Games are kept in least recently used order. A periodic sweep evicts games nobody has
+    touched for ``idle_timeout`` seconds and finished games, and loading a game beyond
+    ``max_games`` evicts the least recently used ones. Games for which ``in_use`` returns True
+    (open websockets) are only evicted when nothing else can make room. An evicted game is
+    rebuilt from the database by ``load`` the next time it is needed.
+
+    Supports ``in``, ``[]`` and ``get`` like the dict it replaces; those do not rehydrate.
+    """
+
+    def __init__(self, max_games: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 sweep_interval: Optional[float] = None, in_use: Optional[Callable[[str], bool]] = None):
+        self.max_games = max_games or int(os.getenv("ACTIVE_GAMES_MAX", 1000))
+        self.idle_timeout = idle_timeout or float(os.getenv("ACTIVE_GAME_IDLE_TIMEOUT", 1800))
+        self.sweep_interval = sweep_interval or float(os.getenv("ACTIVE_GAME_SWEEP_INTERVAL", 60))
+        self.in_use = in_use or (lambda game_id: False)
+        self._games = OrderedDict()
+        self._last_used = {}
+        self._finished = set()
+        self._sweep_task = None
+
+        # Counters
+        self.hits = 0
+        self.rehydrations = 0
+        self.rehydration_ms_total = 0.0
+        self.rehydration_ms_max = 0.0
+        self.evictions = {'idle': 0, 'finished': 0, 'capacity': 0}
+
+    def __contains__(self, game_id: str) -> bool:
+        return game_id in self._games
+
+    def __getitem__(self, game_id: str) -> ChessGame:
+        game = self.get(game_id)
+        if game is None:
+            raise KeyError(game_id)
+        return game
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def get(self, game_id: str) -> Optional[ChessGame]:
+        """The resident game, marked as recently used, or None if it is not in memory"""
+        game = self._games.get(game_id)
+        if game is not None:
+            self._games.move_to_end(game_id)
+            self._last_used[game_id] = time.monotonic()
+        return game
+
+    def load(self, game_id: str, game_data: dict) -> ChessGame:
+        """The game, rebuilt from the database row ``game_data`` and its moves if not resident"""
+        game = self.get(game_id)
+        if game is not None:
+            self.hits += 1
+            return game
+
+        start = time.perf_counter()
+        game = ChessGame(game_id, game_data['white_player_id'], game_data['black_player_id'],
+                         game_data['is_ai_game'])
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.rehydrations += 1
+        self.rehydration_ms_total += elapsed_ms
+        self.rehydration_ms_max = max(self.rehydration_ms_max, elapsed_ms)
+
+        self._games[game_id] = game
+        self._last_used[game_id] = time.monotonic()
+        if game_data.get('status', 'active') != 'active':
+            self._finished.add(game_id)
+        self._make_room()
+        return game
+
+    def mark_finished(self, game_id: str):
+        """A finished game is evicted as soon as nobody is using it"""
+        if game_id in self._games:
+            self._finished.add(game_id)
+
+    def release(self, game_id: str):
+        """Called when a game loses its last user: finished games are dropped right away"""
+        if game_id in self._finished and not self.in_use(game_id):
+            self._evict(game_id, 'finished')
+
+    def _evict(self, game_id: str, reason: str):
+        self._games.pop(game_id, None)
+        self._last_used.pop(game_id, None)
+        self._finished.discard(game_id)
+        self.evictions[reason] += 1
+
+    def _make_room(self):
+        """Evict least recently used games beyond ``max_games``, idle ones before watched ones"""
+        excess = len(self._games) - self.max_games
+        if excess <= 0:
+            return
+        for game_id in [game_id for game_id in self._games if not self.in_use(game_id)][:excess]:
+            self._evict(game_id, 'capacity')
+            excess -= 1
+        # Every remaining game is watched: drop the least recently used anyway
+        for game_id in list(self._games)[:max(excess, 0)]:
+            logger.warning(f"Active game cap {self.max_games} reached, evicting watched game {game_id}")
+            self._evict(game_id, 'capacity')
+
+    def sweep(self) -> int:
+        """Evict finished and idle games nobody is using; returns the number evicted"""
+        deadline = time.monotonic() - self.idle_timeout
+        evicted = 0
+        for game_id in list(self._games):
+            if self.in_use(game_id):
+                continue
+            if game_id in self._finished:
+                self._evict(game_id, 'finished')
+            elif self._last_used[game_id] < deadline:
+                self._evict(game_id, 'idle')
+            else:
+                continue
+            evicted += 1
+        return evicted
+
+    def start(self):
+        """Start the periodic sweep on the running event loop"""
+        if self._sweep_task is None:
+            self._sweep_task = asyncio.ensure_future(self._sweep_loop())
+
+    def shutdown(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = self.sweep()
+            if evicted:
+                logger.info(f"Evicted {evicted} inactive games, {len(self._games)} resident")
+
+    def get_stats(self) -> dict:
+        return {
+            'resident': len(self._games),
+            'max_games': self.max_games,
+            'finished_resident': len(self._finished),
+            'hits': self.hits,
+            'rehydrations': self.rehydrations,
+            'avg_rehydration_ms': round(self.rehydration_ms_total / self.rehydrations, 2) if self.rehydrations else 0,
+            'max_rehydration_ms': round(self.rehydration_ms_max, 2),
+            'evictions': dict(self.evictions)
+        }
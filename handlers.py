@@ -1,20 +1,42 @@
 # handlers.py
+import os
 import tornado.web
 import tornado.websocket
 import tornado.escape
 import tornado.httputil
+import tornado.ioloop
+import chess
 import json
 import hashlib
 import uuid
 import asyncio
+import logging
 from datetime import datetime
 
 from models import Database
-from chess_engine import ChessGame
-from chess_ai import ChessAI
+from chess_ai import ChessAI, history_since_reset
+from ai_worker import ai_pool as worker_pool
+from uci_pool import uci_pool
+from game_manager import ActiveGameManager
+from profiling import PROFILE_MODES, profile_loop
+from replay import replay_cache
 
-# Global state for active games
-active_games = {}
+logger = logging.getLogger(__name__)
+
+# AI backend: the built-in search in worker processes, or pooled UCI engines (AI_BACKEND=uci)
+ai_pool = uci_pool if os.getenv("AI_BACKEND", "builtin") == "uci" else worker_pool
+
+# Usernames allowed to use the admin endpoints
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+
+# Longest profile the admin endpoint will run or wait for, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 300))
+
+# Most positions one replay range request returns
+REPLAY_MAX_RANGE = int(os.getenv("REPLAY_MAX_RANGE", 1000))
+
+# Global state for active games: games with open websockets are kept in memory
+active_games = ActiveGameManager(in_use=lambda game_id: game_id in websocket_connections)
 websocket_connections = {}
 
 
@@ -37,7 +59,9 @@ class MainHandler(BaseHandler):
             self.render("index.html",
                         user=current_user,
                         active_games=active_games_list,
-                        available_games=games_available)
+                        available_games=games_available,
+                        ai_levels=list(ChessAI.LEVELS),
+                        default_ai_level=ChessAI.get_level().name)
         else:
             self.render("home.html")
 
@@ -154,8 +178,11 @@ class GameHandler(BaseHandler):
             opponent_type = self.get_argument("opponent_type", "player")
 
             if opponent_type == "ai":
-                # Create game against AI
-                new_game_id = Database.create_game(current_user['id'], None, is_ai_game=True)
+                # Create game against AI at the chosen strength
+                ai_level = self.get_argument("ai_level", ChessAI.DEFAULT_LEVEL)
+                if ai_level not in ChessAI.LEVELS:
+                    ai_level = ChessAI.get_level().name
+                new_game_id = Database.create_game(current_user['id'], None, is_ai_game=True, ai_level=ai_level)
             else:
                 # Create game waiting for opponent
                 new_game_id = Database.create_game(current_user['id'], None)
@@ -183,6 +210,49 @@ class GameHandler(BaseHandler):
             self.redirect("/")
 
 
+class ReplayHandler(BaseHandler):
+    """Positions of a game for replay viewers.
+
+    ``?ply=N`` returns the position after N plies as JSON. ``?start=A&end=B`` streams positions
+    A to B as newline-delimited JSON, one position per line, for scrubbing through a game.
+    """
+
+    @tornado.web.authenticated
+    async def get(self, game_id):
+        game = Database.get_game(game_id)
+        if not game:
+            raise tornado.web.HTTPError(404)
+        if self.current_user['id'] not in [game['white_player_id'], game['black_player_id']]:
+            raise tornado.web.HTTPError(403)
+
+        # A game being played is replayed from its in-memory moves
+        resident = active_games.get(game_id)
+        try:
+            if resident:
+                replay = replay_cache.get(game_id, resident.moves, resident.start_fen)
+            else:
+                replay = replay_cache.get(game_id)
+        except ValueError as error:
+            # The stored moves do not lead anywhere from the game's start position
+            raise tornado.web.HTTPError(409, str(error))
+
+        try:
+            if self.get_argument("ply", None) is not None:
+                position = replay.seek(int(self.get_argument("ply")))
+                self.write(dict(position, plies=len(replay)))
+                return
+            start = max(0, int(self.get_argument("start", 0)))
+            end = min(int(self.get_argument("end", len(replay))), start + REPLAY_MAX_RANGE - 1)
+        except (ValueError, IndexError) as error:
+            raise tornado.web.HTTPError(400, str(error))
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        for index, position in enumerate(replay.positions(start, end), 1):
+            self.write(json.dumps(position) + "\n")
+            if index % 64 == 0:
+                await self.flush()
+
+
 class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
     def open(self, game_id):
         self.game_id = game_id
@@ -204,32 +274,19 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
             self.close()
             return
 
-        # Initialize or update game if needed
-        if game_id not in active_games:
-            active_games[game_id] = ChessGame(
-                game_id,
-                game_data['white_player_id'],
-                game_data['black_player_id'],
-                game_data['is_ai_game']
-            )
-        else:
-            # Update existing game with current player data
-            game = active_games[game_id]
-            if game_data['black_player_id'] and game.black_player_id != game_data['black_player_id']:
-                # Update black player if it was just set
-                game.black_player_id = game_data['black_player_id']
+        # Use the resident game or rebuild it from the database
+        game = active_games.load(game_id, game_data)
+        if game_data['black_player_id'] and game.black_player_id != game_data['black_player_id']:
+            # Update black player if it was just set
+            game.black_player_id = game_data['black_player_id']
 
         # Send current game state
-        if game_id in active_games:
-            game = active_games[game_id]
-            self.write_message({
-                "type": "game_state",
-                "board": game.get_board_state(),
-                "turn": game.get_current_turn(),
-                "moves": game.get_legal_moves(),
-                "game_status": game.get_game_status(),
-                "is_check": game.board.is_check()
-            })
+        self.write_message(game.get_snapshot())
+
+        # Resume an AI reply that was dropped when every socket closed
+        if game.is_ai_game and game.get_current_turn() == "black" and \
+                game_data['status'] == 'active' and not ai_pool.has_job(game_id):
+            self.schedule_ai_move(game, delay=0)
 
     def on_message(self, message):
         try:
@@ -244,12 +301,27 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
                 self.handle_draw_offer()
             elif message_type == "resign":
                 self.handle_resignation()
+            elif message_type == "sync":
+                self.handle_sync()
+            elif message_type == "history":
+                self.handle_history(data)
+            elif message_type == "threats":
+                self.handle_threats()
 
         except json.JSONDecodeError:
             self.write_message({"type": "error", "message": "Invalid message format"})
 
-    def handle_move(self, data):
+    def get_game(self):
+        """This socket's game, rehydrated from the database if it was evicted"""
         game = active_games.get(self.game_id)
+        if game is None:
+            game_data = Database.get_game(self.game_id)
+            if game_data:
+                game = active_games.load(self.game_id, game_data)
+        return game
+
+    def handle_move(self, data):
+        game = self.get_game()
         if not game:
             self.write_message({"type": "error", "message": "Game not found"})
             return
@@ -261,22 +333,15 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
         # Validate and make move
         if game.make_move(self.user_id, from_square, to_square, promotion):
             # Broadcast move to all connected clients
-            self.broadcast_to_game({
-                "type": "move_made",
-                "from": from_square,
-                "to": to_square,
-                "board": game.get_board_state(),
-                "turn": game.get_current_turn(),
-                "moves": game.get_legal_moves(),
-                "game_status": game.get_game_status(),
-                "is_check": game.board.is_check()
-            })
+            self.broadcast_to_game(game.get_move_delta())
 
             # Check for game end
             status = game.get_game_status()
             if status in ["checkmate", "stalemate", "draw"]:
                 winner_id = game.get_winner_id() if status == "checkmate" else None
                 Database.end_game(self.game_id, winner_id, status)
+                active_games.mark_finished(self.game_id)
+                ai_pool.cancel(self.game_id)
                 self.broadcast_to_game({
                     "type": "game_ended",
                     "status": status,
@@ -285,50 +350,116 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
 
             # If AI game, make AI move
             elif game.is_ai_game and game.get_current_turn() == "black":
-                # Add a small delay for AI move to make it feel more natural
-                async def make_ai_move():
-                    await asyncio.sleep(1)  # 1 second delay
-                    ai_move = ChessAI.get_best_move(game.board)
-                    if ai_move:
-                        ai_from, ai_to = ai_move
-                        if game.make_move(None, ai_from, ai_to):  # AI doesn't have user_id
-                            self.broadcast_to_game({
-                                "type": "move_made",
-                                "from": ai_from,
-                                "to": ai_to,
-                                "board": game.get_board_state(),
-                                "turn": game.get_current_turn(),
-                                "moves": game.get_legal_moves(),
-                                "game_status": game.get_game_status(),
-                                "ai_move": True,
-                                "is_check": game.board.is_check()
-                            })
-
-                            # Check for game end after AI move
-                            ai_status = game.get_game_status()
-                            if ai_status in ["checkmate", "stalemate", "draw"]:
-                                ai_winner_id = game.get_winner_id() if ai_status == "checkmate" else None
-                                Database.end_game(self.game_id, ai_winner_id, ai_status)
-                                self.broadcast_to_game({
-                                    "type": "game_ended",
-                                    "status": ai_status,
-                                    "winner": ai_winner_id
-                                })
-
-                # Schedule the AI move
-                tornado.ioloop.IOLoop.current().add_callback(make_ai_move)
+                self.schedule_ai_move(game)
         else:
             # Provide specific error message
             error_message = "Invalid move"
-            if game.board.is_check():
+            if game.is_check():
                 error_message = "Your king is in check! You must make a move to get out of check."
             self.write_message({
                 "type": "error",
                 "message": error_message,
-                "is_check": game.board.is_check(),
-                "legal_moves": game.get_legal_moves()
+                "is_check": game.is_check(),
+                "legal_moves": game.get_legal_moves_compact()
+            })
+
+    def handle_sync(self):
+        """Resend the full game state to a client that missed a move"""
+        game = self.get_game()
+        if game:
+            self.write_message(game.get_snapshot())
+
+    def handle_history(self, data):
+        """Send the SAN of plies ``start`` to ``end`` (built from the packed moves on demand)"""
+        game = self.get_game()
+        if not game:
+            return
+        try:
+            start = max(0, int(data.get("start", 0)))
+            end = int(data["end"]) if data.get("end") is not None else None
+        except (TypeError, ValueError):
+            self.write_message({"type": "error", "message": "Invalid history range"})
+            return
+        self.write_message({
+            "type": "history",
+            "start": start,
+            "seq": game.seq,
+            "moves": [entry['san'] for entry in game.get_move_history(start, end)]
+        })
+
+    def handle_threats(self):
+        """Send the attackers of every square (cached per position on the game)"""
+        game = self.get_game()
+        if game:
+            self.write_message({
+                "type": "threats",
+                "seq": game.seq,
+                "squares": game.get_threat_map()
             })
 
+    def schedule_ai_move(self, game, delay=0.3):
+        """Ask the AI worker pool for a reply and broadcast it when it arrives"""
+        async def make_ai_move():
+            if self.game_id not in websocket_connections:
+                return
+            fen = game.get_fen()
+
+            # A small minimum delay makes instant (pondered) replies feel more natural;
+            # it runs alongside the search instead of before it
+            pause = asyncio.ensure_future(asyncio.sleep(delay))
+
+            # Search in the worker pool so other games keep moving meanwhile
+            level = ChessAI.get_level(game.ai_level)
+            try:
+                result = await ai_pool.submit(self.game_id, fen, depth=level.depth, time_limit=level.time_limit,
+                                              node_limit=level.node_limit, noise=level.noise,
+                                              history=history_since_reset(game.board))
+            except Exception as error:
+                logger.exception(f"AI search failed in game {self.game_id}: {error!r}")
+                self.broadcast_to_game({
+                    "type": "error",
+                    "message": "The AI could not find a move. Reload the page to let it try again."
+                })
+                return
+            await pause
+            if not result or not result['move'] or game.get_fen() != fen:
+                return
+
+            move = chess.Move.from_uci(result['move'])
+            ai_from = chess.square_name(move.from_square)
+            ai_to = chess.square_name(move.to_square)
+            promotion = chess.piece_symbol(move.promotion) if move.promotion else None
+            ply = game.board.ply()
+            if game.make_move(None, ai_from, ai_to, promotion):  # AI doesn't have user_id
+                Database.record_ai_move(self.game_id, ply, result['move'], level.name, result['depth'],
+                                        result['nodes'] + result['qnodes'], result['time_ms'],
+                                        result['from_book'], result['from_cache'])
+                self.broadcast_to_game(dict(game.get_move_delta(), ai_move=True))
+
+                # Check for game end after AI move
+                ai_status = game.get_game_status()
+                if ai_status in ["checkmate", "stalemate", "draw"]:
+                    ai_winner_id = game.get_winner_id() if ai_status == "checkmate" else None
+                    Database.end_game(self.game_id, ai_winner_id, ai_status)
+                    active_games.mark_finished(self.game_id)
+                    self.broadcast_to_game({
+                        "type": "game_ended",
+                        "status": ai_status,
+                        "winner": ai_winner_id
+                    })
+                elif result.get('ponder'):
+                    # Think about the expected reply while the player is on the move
+                    ponder_board = game.board.copy()
+                    ponder_move = chess.Move.from_uci(result['ponder'])
+                    if ponder_board.is_legal(ponder_move):
+                        ponder_board.push(ponder_move)
+                        ai_pool.ponder(self.game_id, ponder_board.fen(), depth=level.depth,
+                                       time_limit=level.time_limit, node_limit=level.node_limit, noise=level.noise,
+                                       history=history_since_reset(ponder_board))
+
+        # Schedule the AI move
+        tornado.ioloop.IOLoop.current().add_callback(make_ai_move)
+
     def handle_chat(self, data):
         message = data.get("message", "")
         user = Database.get_user_by_id(self.user_id)
@@ -341,7 +472,7 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
             })
 
     def handle_draw_offer(self):
-        game = active_games.get(self.game_id)
+        game = self.get_game()
         if game:
             self.broadcast_to_game({
                 "type": "draw_offered",
@@ -349,11 +480,13 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
             }, exclude_self=True)
 
     def handle_resignation(self):
-        game = active_games.get(self.game_id)
+        game = self.get_game()
         if game:
             # Determine winner
             winner_id = game.black_player_id if self.user_id == game.white_player_id else game.white_player_id
             Database.end_game(self.game_id, winner_id, "resignation")
+            active_games.mark_finished(self.game_id)
+            ai_pool.cancel(self.game_id)
 
             self.broadcast_to_game({
                 "type": "game_ended",
@@ -363,6 +496,8 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
 
     def broadcast_to_game(self, message, exclude_self=False):
         if self.game_id in websocket_connections:
+            # Encode once for every connection instead of once per write_message
+            message = json.dumps(message)
             for connection in websocket_connections[self.game_id]:
                 if exclude_self and connection == self:
                     continue
@@ -376,6 +511,9 @@ class GameWebSocketHandler(tornado.websocket.WebSocketHandler):
             websocket_connections[self.game_id].remove(self)
             if not websocket_connections[self.game_id]:
                 del websocket_connections[self.game_id]
+                # Nobody is watching any more: drop the pending AI search
+                ai_pool.cancel(self.game_id)
+                active_games.release(self.game_id)
 
     def get_secure_cookie(self, name):
         # Override to get cookie from WebSocket
@@ -412,4 +550,62 @@ class LeaderboardHandler(BaseHandler):
                     total_games=total_games,
                     highest_rating=highest_rating,
                     average_rating=average_rating,
-                    total_pages=1)  # For simplicity, using 1 page
\ No newline at end of file
+                    total_pages=1)  # For simplicity, using 1 page
+
+
+class AdminProfilingHandler(BaseHandler):
+    """Profile the running server on demand (users listed in ADMIN_USERS only).
+
+    ``?seconds=10&mode=cprofile`` profiles the IOLoop thread (websocket handlers, game logic)
+    and returns pstats text; ``mode=sample`` returns collapsed stacks instead.
+    ``?game_id=...`` waits up to ``seconds`` (default ``PROFILE_MAX_SECONDS``) for the game's next
+    AI search and returns its pstats text; ``mode`` does not apply to it.
+    """
+
+    @tornado.web.authenticated
+    async def get(self):
+        if self.current_user['username'] not in ADMIN_USERS:
+            raise tornado.web.HTTPError(403)
+
+        game_id = self.get_argument("game_id", None)
+        mode = self.get_argument("mode", "cprofile")
+        try:
+            seconds = min(float(self.get_argument("seconds", PROFILE_MAX_SECONDS if game_id else 10)),
+                          PROFILE_MAX_SECONDS)
+        except ValueError:
+            raise tornado.web.HTTPError(400, "seconds must be a number")
+        if mode not in PROFILE_MODES:
+            raise tornado.web.HTTPError(400, f"mode must be one of {', '.join(PROFILE_MODES)}")
+
+        if game_id:
+            waiter = ai_pool.profile_next(game_id)
+            if waiter is None:
+                raise tornado.web.HTTPError(400, "the AI backend does not support profiling")
+            try:
+                dump = await asyncio.wait_for(asyncio.shield(waiter), seconds)
+            except asyncio.TimeoutError:
+                # Do not leave the request behind to profile some later, unrelated search
+                ai_pool.cancel_profile(game_id, waiter)
+                raise tornado.web.HTTPError(504, "no AI search for this game in time")
+        else:
+            try:
+                dump = await profile_loop(seconds, mode)
+            except RuntimeError as error:
+                raise tornado.web.HTTPError(409, str(error))
+
+        self.set_header("Content-Type", "text/plain; charset=utf-8")
+        self.write(dump or "")
+
+
+class AdminStatsHandler(BaseHandler):
+    """Counters of the in-memory game manager and the AI backend as JSON (ADMIN_USERS only)"""
+
+    @tornado.web.authenticated
+    def get(self):
+        if self.current_user['username'] not in ADMIN_USERS:
+            raise tornado.web.HTTPError(403)
+
+        self.write({
+            'active_games': active_games.get_stats(),
+            'ai_pool': ai_pool.get_stats()
+        })
@@ -26,11 +26,15 @@ from handlers import (
     ProfileHandler,
     GameHandler,
     GameWebSocketHandler,
-    LeaderboardHandler
+    LeaderboardHandler,
+    AdminProfilingHandler,
+    AdminStatsHandler,
+    ReplayHandler
 )
 from models import Database
 from chess_engine import ChessGame
 from chess_ai import ChessAI
+from handlers import ai_pool, active_games
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,10 +50,6 @@ settings = {
     "debug": os.getenv("DEBUG", "True").lower() == "true",
 }
 
-# Global state for active games
-active_games = {}
-websocket_connections = {}
-
 
 def make_app():
     return tornado.web.Application([
@@ -59,9 +59,12 @@ def make_app():
         (r"/logout", LogoutHandler),
         (r"/profile", ProfileHandler),
         (r"/game/new", GameHandler),  # Add this route for creating new games
+        (r"/game/([^/]+)/replay", ReplayHandler),
         (r"/game/([^/]+)", GameHandler),  # Keep this for viewing games
         (r"/websocket/([^/]+)", GameWebSocketHandler),
         (r"/leaderboard", LeaderboardHandler),
+        (r"/admin/profiling", AdminProfilingHandler),
+        (r"/admin/stats", AdminStatsHandler),
     ], **settings)
 
 
@@ -102,7 +105,16 @@ def main():
         logger.info(f"Chess application started on http://{host}:{port}")
 
     logger.info(f"Debug mode: {settings['debug']}")
-    tornado.ioloop.IOLoop.current().start()
+
+    # Start the AI backend up front so the first AI move pays no spawn cost
+    io_loop = tornado.ioloop.IOLoop.current()
+    io_loop.add_callback(ai_pool.start)
+    io_loop.add_callback(active_games.start)
+    try:
+        io_loop.start()
+    finally:
+        active_games.shutdown()
+        ai_pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -5,11 +5,15 @@ import uuid
 from datetime import datetime
 import math
 import os
+import logging
+import chess
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 class Database:
     DB_PATH = os.getenv("DATABASE_PATH", "chess.db")
@@ -38,9 +42,11 @@ class Database:
                 white_player_id INTEGER NOT NULL,
                 black_player_id INTEGER,
                 is_ai_game BOOLEAN DEFAULT FALSE,
+                ai_level TEXT,
                 status TEXT DEFAULT 'active',
                 winner_id INTEGER,
                 fen_position TEXT,
+                start_fen TEXT,
                 moves TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 ended_at TIMESTAMP,
@@ -70,9 +76,102 @@ class Database:
             )
         """)
 
+        # Search statistics of every AI move, for capacity planning
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ai_move_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                game_id TEXT NOT NULL,
+                ply INTEGER NOT NULL,
+                move TEXT,
+                ai_level TEXT,
+                depth INTEGER,
+                nodes INTEGER,
+                time_ms INTEGER,
+                from_book BOOLEAN DEFAULT FALSE,
+                from_cache BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (game_id) REFERENCES games (id)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_move_stats_level ON ai_move_stats (ai_level)")
+
+        # Moves of every game, one row per ply (replaces the games.moves JSON blob)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS game_moves (
+                game_id TEXT NOT NULL,
+                ply INTEGER NOT NULL,
+                uci TEXT NOT NULL,
+                san TEXT,
+                fen TEXT,
+                PRIMARY KEY (game_id, ply),
+                FOREIGN KEY (game_id) REFERENCES games (id)
+            )
+        """)
+
+        # Columns added after the first release
+        cursor.execute("PRAGMA table_info(games)")
+        game_columns = [row[1] for row in cursor.fetchall()]
+        if 'ai_level' not in game_columns:
+            cursor.execute("ALTER TABLE games ADD COLUMN ai_level TEXT")
+        if 'start_fen' not in game_columns:
+            # Position the game_moves rows start from; NULL is the standard starting position
+            cursor.execute("ALTER TABLE games ADD COLUMN start_fen TEXT")
+
         conn.commit()
         conn.close()
 
+        cls.migrate_move_history()
+
+    @classmethod
+    def migrate_move_history(cls):
+        """Move the games.moves JSON blobs of older games into game_moves rows.
+
+        Each game is copied in its own transaction, and its blob is only cleared once the
+        number of rows stored for it matches the number of moves.
+        """
+        # chess_engine imports this module, so import its converters here
+        from chess_engine import history_from_json, unpack_move
+
+        conn = sqlite3.connect(cls.DB_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT id, moves FROM games WHERE moves IS NOT NULL AND moves != '[]'")
+        games = cursor.fetchall()
+
+        migrated = 0
+        for game_id, moves in games:
+            try:
+                board = chess.Board()
+                rows = []
+                for ply, move in enumerate(map(unpack_move, history_from_json(moves))):
+                    if not board.is_legal(move):
+                        raise ValueError(f"illegal move {move.uci()} at ply {ply}")
+                    san = board.san(move)
+                    board.push(move)
+                    rows.append((game_id, ply, move.uci(), san, board.fen()))
+            except (ValueError, KeyError, TypeError, AttributeError, OverflowError) as error:
+                # Leave the blob in place so the game can still be inspected or fixed by hand
+                logger.error(f"Could not migrate the moves of game {game_id}: {error!r}")
+                continue
+
+            cursor.executemany("INSERT OR IGNORE INTO game_moves (game_id, ply, uci, san, fen) VALUES (?, ?, ?, ?, ?)",
+                               rows)
+            cursor.execute("SELECT COUNT(*) FROM game_moves WHERE game_id = ?", (game_id,))
+            stored = cursor.fetchone()[0]
+            if stored != len(rows):
+                conn.rollback()
+                logger.error(f"Could not migrate the moves of game {game_id}: "
+                             f"{stored} rows stored for {len(rows)} moves, keeping the blob")
+                continue
+
+            cursor.execute("UPDATE games SET moves = NULL WHERE id = ?", (game_id,))
+            conn.commit()
+            migrated += 1
+
+        conn.close()
+
+        return migrated
+
     @classmethod
     def create_user(cls, username, email, password):
         conn = sqlite3.connect(cls.DB_PATH)
@@ -135,17 +234,17 @@ class Database:
         return dict(user) if user else None
 
     @classmethod
-    def create_game(cls, white_player_id, black_player_id, is_ai_game=False):
+    def create_game(cls, white_player_id, black_player_id, is_ai_game=False, ai_level=None):
         conn = sqlite3.connect(cls.DB_PATH)
         cursor = conn.cursor()
 
         game_id = str(uuid.uuid4())
 
         cursor.execute("""
-            INSERT INTO games (id, white_player_id, black_player_id, is_ai_game, fen_position, moves)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (game_id, white_player_id, black_player_id, is_ai_game,
-              "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "[]"))
+            INSERT INTO games (id, white_player_id, black_player_id, is_ai_game, ai_level, fen_position, moves)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (game_id, white_player_id, black_player_id, is_ai_game, ai_level,
+              "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", None))
 
         conn.commit()
         conn.close()
@@ -164,6 +263,18 @@ class Database:
 
         return dict(game) if game else None
 
+    @classmethod
+    def get_finished_games(cls):
+        conn = sqlite3.connect(cls.DB_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT * FROM games WHERE status != 'active' ORDER BY ended_at")
+        games = cursor.fetchall()
+        conn.close()
+
+        return [dict(game) for game in games]
+
     @classmethod
     def join_game(cls, game_id, black_player_id):
         conn = sqlite3.connect(cls.DB_PATH)
@@ -188,6 +299,60 @@ class Database:
         conn.commit()
         conn.close()
 
+    @classmethod
+    def set_start_fen(cls, game_id, start_fen):
+        """Record the position a game's stored moves are played from"""
+        conn = sqlite3.connect(cls.DB_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute("UPDATE games SET start_fen = ? WHERE id = ?", (start_fen, game_id))
+
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def add_game_move(cls, game_id, ply, uci, fen_position=None, san=None):
+        """Append one move to a game and store the resulting position.
+
+        Each ply writes one small row, so the cost per move does not grow with the game.
+        The row keeps the move's SAN and the FEN after it for tools that read the table directly.
+        """
+        conn = sqlite3.connect(cls.DB_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute("INSERT INTO game_moves (game_id, ply, uci, san, fen) VALUES (?, ?, ?, ?, ?)",
+                       (game_id, ply, uci, san, fen_position))
+        if fen_position:
+            cursor.execute("UPDATE games SET fen_position = ? WHERE id = ?", (fen_position, game_id))
+
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def get_game_moves(cls, game_id):
+        """Moves of a game in order, as dicts with ply, uci, san and fen"""
+        conn = sqlite3.connect(cls.DB_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT ply, uci, san, fen FROM game_moves WHERE game_id = ? ORDER BY ply", (game_id,))
+        moves = cursor.fetchall()
+        conn.close()
+
+        return [dict(move) for move in moves]
+
+    @classmethod
+    def count_game_moves(cls, game_id):
+        """Number of moves stored for a game"""
+        conn = sqlite3.connect(cls.DB_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT COUNT(*) FROM game_moves WHERE game_id = ?", (game_id,))
+        count = cursor.fetchone()[0]
+        conn.close()
+
+        return count
+
     @classmethod
     def end_game(cls, game_id, winner_id, status):
         conn = sqlite3.connect(cls.DB_PATH)
@@ -240,6 +405,46 @@ class Database:
         conn.commit()
         conn.close()
 
+    @classmethod
+    def record_ai_move(cls, game_id, ply, move, ai_level, depth, nodes, time_ms, from_book=False,
+                       from_cache=False):
+        conn = sqlite3.connect(cls.DB_PATH)
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT INTO ai_move_stats (game_id, ply, move, ai_level, depth, nodes, time_ms, from_book, from_cache)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (game_id, ply, move, ai_level, depth, nodes, time_ms, from_book, from_cache))
+
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def get_ai_level_stats(cls):
+        """Per-level averages and maxima of AI search cost"""
+        conn = sqlite3.connect(cls.DB_PATH)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT ai_level,
+                   COUNT(*) as moves,
+                   AVG(nodes) as avg_nodes,
+                   MAX(nodes) as max_nodes,
+                   AVG(depth) as avg_depth,
+                   AVG(time_ms) as avg_time_ms,
+                   MAX(time_ms) as max_time_ms,
+                   SUM(CASE WHEN from_book OR from_cache THEN 1 ELSE 0 END) as unsearched_moves
+            FROM ai_move_stats
+            GROUP BY ai_level
+            ORDER BY avg_nodes
+        """)
+
+        stats = cursor.fetchall()
+        conn.close()
+
+        return [dict(row) for row in stats]
+
     @classmethod
     def calculate_elo(cls, rating1, rating2, score1, k_factor=32):
         """Calculate new ELO ratings based on game result"""
@@ -0,0 +1,158 @@
+# opening_book.py
+"""
+Opening book stored as a polyglot-format binary file.
+
+Each 16-byte record is (Zobrist key, move, weight, learn), sorted by key. Lookups memory-map
+the file and binary-search it, so opening the book costs nothing until the first probe.
+"""
+
+import os
+import struct
+import argparse
+from collections import Counter
+from typing import Iterable, Optional
+
+import chess
+import chess.pgn
+import chess.polyglot
+from dotenv import load_dotenv
+
+from models import Database
+
+# Load environment variables
+load_dotenv()
+
+ENTRY_STRUCT = struct.Struct(">QHHI")
+PROMOTION_CODES = {chess.KNIGHT: 1, chess.BISHOP: 2, chess.ROOK: 3, chess.QUEEN: 4}
+
+
+class OpeningBook:
+    """Read-only opening book, opened lazily on the first lookup"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("OPENING_BOOK_PATH", "book.bin")
+        self._reader = None
+        self._missing = False
+        self.hits = 0
+        self.misses = 0
+
+    def _get_reader(self):
+        if self._reader is None and not self._missing:
+            if os.path.exists(self.path):
+                self._reader = chess.polyglot.open_reader(self.path)
+            else:
+                self._missing = True
+        return self._reader
+
+    def get_move(self, board: chess.Board, weighted_random: bool = True) -> Optional[chess.Move]:
+        """Return a book move for the position, or None when it is out of book"""
+        reader = self._get_reader()
+        if reader is None:
+            return None
+
+        try:
+            if weighted_random:
+                entry = reader.weighted_choice(board)
+            else:
+                entry = reader.find(board)
+        except IndexError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry.move
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'loaded': self._reader is not None,
+            'entries': len(self._reader) if self._reader is not None else 0,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+def encode_move(board: chess.Board, move: chess.Move) -> int:
+    """Encode a move the polyglot way (castling as king-takes-rook)"""
+    to_square = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_file = 7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0
+        to_square = chess.square(to_file, rank)
+
+    promotion = PROMOTION_CODES.get(move.promotion, 0)
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+
+class BookBuilder:
+    """Collects (position, move) counts from games and writes a sorted book file"""
+
+    def __init__(self, max_ply: int = 20):
+        self.max_ply = max_ply
+        self.counts = Counter()
+        self.games = 0
+
+    def add_moves(self, moves: Iterable[chess.Move], board: Optional[chess.Board] = None):
+        """Add the opening moves of one game"""
+        board = board or chess.Board()
+        for move in moves:
+            if board.ply() >= self.max_ply or not board.is_legal(move):
+                break
+            self.counts[(chess.polyglot.zobrist_hash(board), encode_move(board, move))] += 1
+            board.push(move)
+        self.games += 1
+
+    def add_pgn(self, path: str):
+        """Add every game of a PGN file"""
+        with open(path) as pgn:
+            while True:
+                game = chess.pgn.read_game(pgn)
+                if game is None:
+                    break
+                self.add_moves(game.mainline_moves(), game.board())
+
+    def add_database_games(self):
+        """Add finished games from the games table"""
+        for game in Database.get_finished_games():
+            moves = [chess.Move.from_uci(row['uci']) for row in Database.get_game_moves(game['id'])]
+            self.add_moves(moves)
+
+    def write(self, path: str, min_count: int = 1) -> int:
+        """Write the book sorted by key and return the number of entries"""
+        entries = sorted(
+            (key, move, min(count, 0xFFFF))
+            for (key, move), count in self.counts.items()
+            if count >= min_count
+        )
+        with open(path, "wb") as book:
+            for key, move, weight in entries:
+                book.write(ENTRY_STRUCT.pack(key, move, weight, 0))
+        return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the AI opening book")
+    parser.add_argument("--pgn", nargs="*", default=[], help="PGN files to read")
+    parser.add_argument("--db", action="store_true", help="include finished games from the database")
+    parser.add_argument("--output", default=os.getenv("OPENING_BOOK_PATH", "book.bin"))
+    parser.add_argument("--max-ply", type=int, default=20)
+    parser.add_argument("--min-count", type=int, default=1)
+    args = parser.parse_args()
+
+    builder = BookBuilder(args.max_ply)
+    for path in args.pgn:
+        builder.add_pgn(path)
+    if args.db:
+        builder.add_database_games()
+
+    entries = builder.write(args.output, args.min_count)
+    print(f"Wrote {entries} entries from {builder.games} games to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
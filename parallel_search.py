@@ -0,0 +1,165 @@
+# parallel_search.py
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import chess
+
+from chess_ai import ChessAI, SearchContext, SearchResult, board_from_history, history_since_reset
+
+# Positions used to compare serial and parallel search
+BENCHMARK_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQ1RK1 w - - 0 7",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 b - - 3 10",
+    "2r2rk1/pp1q1ppp/2n1pn2/3p4/3P4/P1N1PN2/1PQ2PPP/2R2RK1 w - - 0 15",
+    "8/5pk1/6p1/3P4/1p3P2/1P4P1/6K1/8 w - - 0 40",
+]
+
+
+def _search_subset(fen: str, moves: list, depth: Optional[int], time_limit: Optional[float],
+                   deterministic: bool, algorithm: Optional[str] = None, history: Optional[tuple] = None,
+                   node_limit: Optional[int] = None, noise: int = 0) -> dict:
+    """Worker: search only the given root moves of a position"""
+    board = board_from_history(fen, history)
+    root_moves = [chess.Move.from_uci(uci) for uci in moves]
+    result = ChessAI.search(board, depth=depth, time_limit=time_limit, node_limit=node_limit,
+                            root_moves=root_moves, deterministic=deterministic, algorithm=algorithm,
+                            noise=noise)
+    return {
+        'move': result.move.uci() if result.move else None,
+        'score': result.score,
+        'depth': result.depth,
+        'nodes': result.nodes,
+        'qnodes': result.qnodes
+    }
+
+
+class ParallelSearch:
+    """Root-splitting search over a pool of worker processes.
+
+    Root moves are ordered as the serial search orders them and dealt round-robin so every
+    worker gets a mix of promising and poor moves. Each worker returns the exact score of the
+    best move in its share; the overall best is the highest score for the side to move, ties
+    going to the move that comes first in root order. In ``deterministic`` mode with the
+    "minimax" algorithm this is the same move ``ChessAI.search(board, depth, deterministic=True)``
+    returns; the negamax pruning depends on the search window, so its shares can differ slightly.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or int(os.getenv("AI_SEARCH_PROCESSES", os.cpu_count() or 1))
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+
+    def search(self, board: chess.Board, depth: Optional[int] = None, time_limit: Optional[float] = None,
+               deterministic: bool = False, algorithm: Optional[str] = None, node_limit: Optional[int] = None,
+               noise: int = 0) -> SearchResult:
+        """Search ``board`` like ``ChessAI.search``; ``node_limit`` is shared out between the workers"""
+        start_time = time.monotonic()
+        result = SearchResult()
+
+        root_moves = list(board.legal_moves)
+        if not root_moves:
+            return result
+        if depth is None and time_limit is None and node_limit is None:
+            depth = 3
+
+        # Same root order as the serial search
+        context = SearchContext(root_ply=len(board.move_stack))
+        root_moves = ChessAI.order_moves(board, root_moves, None, context)
+        order = {move: index for index, move in enumerate(root_moves)}
+
+        fen = board.fen()
+        history = history_since_reset(board)
+        shares = min(self.workers, len(root_moves))
+        share_nodes = max(node_limit // shares, 1) if node_limit else None
+        futures = []
+        for share in range(shares):
+            moves = [move.uci() for move in root_moves[share::self.workers]]
+            futures.append(self.executor.submit(_search_subset, fen, moves, depth, time_limit, deterministic,
+                                                algorithm, history, share_nodes, noise))
+
+        sign = 1 if board.turn == chess.WHITE else -1
+        best = None
+        for future in futures:
+            outcome = future.result()
+            result.nodes += outcome['nodes']
+            result.qnodes += outcome['qnodes']
+            if outcome['move'] is None:
+                continue
+            move = chess.Move.from_uci(outcome['move'])
+            key = (sign * outcome['score'], -order[move])
+            if best is None or key > best[0]:
+                best = (key, move, outcome)
+
+        if best is not None:
+            _, result.move, outcome = best
+            result.score = outcome['score']
+            result.depth = outcome['depth']
+        result.time_ms = int((time.monotonic() - start_time) * 1000)
+        return result
+
+    def warm_up(self):
+        """Start every worker process so later timings exclude spawn cost"""
+        fen = chess.STARTING_FEN
+        futures = [self.executor.submit(_search_subset, fen, ["e2e4"], 1, None, True)
+                   for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def benchmark(fens: Optional[list] = None, depth: int = 3, workers: Optional[int] = None,
+              algorithm: str = "minimax") -> list:
+    """Compare deterministic serial and parallel searches at a fixed depth"""
+    fens = fens or BENCHMARK_FENS
+    rows = []
+    searcher = ParallelSearch(workers)
+    try:
+        searcher.warm_up()
+
+        for fen in fens:
+            board = chess.Board(fen)
+
+            start = time.monotonic()
+            serial = ChessAI.search(board, depth=depth, deterministic=True, algorithm=algorithm)
+            serial_time = time.monotonic() - start
+
+            start = time.monotonic()
+            parallel = searcher.search(board, depth=depth, deterministic=True, algorithm=algorithm)
+            parallel_time = time.monotonic() - start
+
+            rows.append({
+                'fen': fen,
+                'serial_move': serial.move.uci() if serial.move else None,
+                'parallel_move': parallel.move.uci() if parallel.move else None,
+                'same_move': serial.move == parallel.move,
+                'serial_ms': int(serial_time * 1000),
+                'parallel_ms': int(parallel_time * 1000),
+                'speedup': round(serial_time / parallel_time, 2) if parallel_time else 0.0
+            })
+    finally:
+        searcher.shutdown()
+    return rows
+
+
+def main():
+    print("Parallel root-split search benchmark")
+    print("=" * 36)
+    rows = benchmark()
+    for row in rows:
+        print(f"{row['serial_move']:>6} {row['parallel_move']:>6} same={row['same_move']!s:5} "
+              f"serial={row['serial_ms']:>6}ms parallel={row['parallel_ms']:>6}ms x{row['speedup']}")
+    total_serial = sum(row['serial_ms'] for row in rows)
+    total_parallel = sum(row['parallel_ms'] for row in rows)
+    if total_parallel:
+        print(f"\nOverall speedup: x{total_serial / total_parallel:.2f}")
+
+
+if __name__ == "__main__":
+    main()
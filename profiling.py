@@ -0,0 +1,126 @@
+# profiling.py
+"""
+On-demand profiling and cheap logging for diagnosing slow games in production.
+
+``profile_loop`` runs cProfile (pstats text) or a sampling stack profiler (collapsed stacks,
+one ``frame;frame;frame count`` line per stack, as read by flamegraph tools) on the IOLoop
+thread for a number of seconds. AI searches run in worker processes; those are profiled
+through ``AIWorkerPool.profile_next``, which uses ``profile_call`` inside the worker.
+"""
+
+import io
+import sys
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+import threading
+from collections import Counter
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Only one profiler may run on the IOLoop thread at a time
+_busy = False
+
+
+def format_pstats(profiler: cProfile.Profile, limit: int = 60) -> str:
+    """The ``limit`` most expensive functions by cumulative time, as pstats text"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+def profile_call(function, *args, **kwargs):
+    """Run ``function`` under cProfile and return (result, pstats text)"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        profiler.disable()
+    return result, format_pstats(profiler)
+
+
+class StackSampler:
+    """Samples one thread's stack every ``interval`` seconds from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks, most frequent first"""
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+async def profile_loop(seconds: float, mode: str = "cprofile") -> str:
+    """Profile everything the IOLoop thread does for ``seconds`` and return the dump"""
+    global _busy
+    if _busy:
+        raise RuntimeError("a profile is already running")
+    _busy = True
+    try:
+        if mode == "sample":
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            await asyncio.sleep(seconds)
+            return sampler.stop()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        return format_pstats(profiler)
+    finally:
+        _busy = False
+
+
+class RateLimitFilter(logging.Filter):
+    """Let each message template through at most ``burst`` times per ``interval`` seconds.
+
+    Records are grouped by their unformatted message, so a log call that fires on every move
+    cannot flood the log; the number suppressed is added to the next record let through.
+    """
+
+    def __init__(self, interval: float = 60, burst: int = 10):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = record.msg
+        now = time.monotonic()
+        start, count, suppressed = self._windows.get(key, (now, 0, 0))
+        if now - start >= self.interval:
+            start, count = now, 0
+        if count >= self.burst:
+            self._windows[key] = (start, count, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        self._windows[key] = (start, count + 1, 0)
+        return True
@@ -0,0 +1,141 @@
+# replay.py
+"""
+Seeking to any position of a game for replay viewers.
+
+``GameReplay`` keeps a board checkpoint every ``CHECKPOINT_INTERVAL`` plies, so the position
+at any ply is at most ``CHECKPOINT_INTERVAL - 1`` moves away from a stored board: seek time
+does not grow with the length of the game. ``ReplayCache`` keeps the replays of recently
+viewed games and brings them up to date as games continue.
+"""
+
+import os
+from array import array
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+import chess
+from dotenv import load_dotenv
+
+from models import Database
+from chess_engine import pack_move, unpack_move, start_position
+
+# Load environment variables
+load_dotenv()
+
+CHECKPOINT_INTERVAL = int(os.getenv("REPLAY_CHECKPOINT_INTERVAL", 16))
+
+
+class GameReplay:
+    """Checkpointed positions of one game's packed moves (see ``chess_engine.pack_move``)"""
+
+    def __init__(self, moves=(), interval: int = CHECKPOINT_INTERVAL, start_fen: str = chess.STARTING_FEN):
+        self.interval = interval
+        self.start_fen = start_fen
+        self.moves = array('H')
+        # Board at ply i * interval, without move stacks
+        self.checkpoints = [chess.Board(start_fen)]
+        self._board = chess.Board(start_fen)
+        self.extend(moves)
+
+    def __len__(self) -> int:
+        """Number of moves; positions go from ply 0 to ply len()"""
+        return len(self.moves)
+
+    def extend(self, moves):
+        """Append moves played after the ones already replayed.
+
+        Raises ``ValueError`` at the first move that is illegal in its position, which means
+        the moves do not belong to ``start_fen``.
+        """
+        for packed in moves:
+            move = unpack_move(packed)
+            if not self._board.is_legal(move):
+                raise ValueError(f"move {move.uci()} at ply {len(self.moves)} is illegal")
+            self._board.push(move)
+            self.moves.append(packed)
+            if len(self.moves) % self.interval == 0:
+                self.checkpoints.append(self._board.copy(stack=False))
+
+    def sync(self, moves) -> bool:
+        """Catch up with ``moves`` (the game's full move list); False if they do not extend ours"""
+        if len(moves) < len(self.moves) or moves[:len(self.moves)] != self.moves:
+            return False
+        self.extend(moves[len(self.moves):])
+        return True
+
+    def board_at(self, ply: int) -> chess.Board:
+        """A fresh board at ``ply``, replayed from the nearest checkpoint at or before it"""
+        if not 0 <= ply <= len(self.moves):
+            raise IndexError(f"ply {ply} is outside 0..{len(self.moves)}")
+        checkpoint = ply // self.interval
+        board = self.checkpoints[checkpoint].copy(stack=False)
+        for index in range(checkpoint * self.interval, ply):
+            board.push(unpack_move(self.moves[index]))
+        return board
+
+    def seek(self, ply: int) -> dict:
+        """The position at ``ply`` and the move that led to it"""
+        if not 0 <= ply <= len(self.moves):
+            raise IndexError(f"ply {ply} is outside 0..{len(self.moves)}")
+        return next(self.positions(ply, ply))
+
+    def positions(self, start: int, end: int) -> Iterator[dict]:
+        """Positions ``start`` to ``end`` (inclusive), replaying forward after one seek"""
+        end = min(end, len(self.moves))
+        if start == 0:
+            board = self.board_at(0)
+            yield self._position(board, 0, None, None)
+            start = 1
+        elif start <= end:
+            board = self.board_at(start - 1)
+        for ply in range(start, end + 1):
+            move = unpack_move(self.moves[ply - 1])
+            san = board.san(move)
+            board.push(move)
+            yield self._position(board, ply, move, san)
+
+    @staticmethod
+    def _position(board: chess.Board, ply: int, move: Optional[chess.Move], san: Optional[str]) -> dict:
+        return {
+            'ply': ply,
+            'fen': board.fen(),
+            'move': move.uci() if move else None,
+            'san': san,
+            'is_check': board.is_check()
+        }
+
+
+class ReplayCache:
+    """Replays of recently viewed games, least recently used evicted beyond ``max_games``"""
+
+    def __init__(self, max_games: Optional[int] = None):
+        self.max_games = max_games or int(os.getenv("REPLAY_CACHE_SIZE", 64))
+        self._replays = OrderedDict()
+
+    def get(self, game_id: str, moves=None, start_fen: Optional[str] = None) -> GameReplay:
+        """The game's replay, up to date with ``moves`` (played from ``start_fen``) if given,
+        else with the database.
+
+        Raises ``ValueError`` if the moves cannot be replayed from the game's start position.
+        """
+        replay = self._replays.pop(game_id, None)
+        if moves is None and (replay is None or Database.count_game_moves(game_id) != len(replay)):
+            # Not cached, or moves were played since it was cached
+            moves = self._load_moves(game_id)
+            start_fen = start_position(Database.get_game(game_id) or {}, bool(moves))
+        start_fen = start_fen or chess.STARTING_FEN
+        if moves is not None and (replay is None or replay.start_fen != start_fen or not replay.sync(moves)):
+            replay = GameReplay(moves, start_fen=start_fen)
+
+        self._replays[game_id] = replay
+        while len(self._replays) > self.max_games:
+            self._replays.popitem(last=False)
+        return replay
+
+    @staticmethod
+    def _load_moves(game_id: str) -> array:
+        return array('H', (pack_move(chess.Move.from_uci(row['uci'])) for row in Database.get_game_moves(game_id)))
+
+
+# Shared cache used by the replay handler
+replay_cache = ReplayCache()
@@ -0,0 +1,66 @@
+# search_benchmark.py
+import time
+import random
+import argparse
+from typing import Optional
+
+import chess
+
+from chess_ai import ChessAI
+from parallel_search import BENCHMARK_FENS
+
+
+def benchmark(fens: Optional[list] = None, depths: Optional[list] = None,
+              algorithms: Optional[list] = None) -> list:
+    """Nodes-to-depth and time-to-depth of each search algorithm on a position set.
+
+    Every (algorithm, depth) pair searches each position from scratch with a fresh transposition
+    table, without the opening book, so the numbers only reflect the search itself.
+    """
+    fens = fens or BENCHMARK_FENS
+    depths = depths or [3, 4, 5]
+    algorithms = algorithms or list(ChessAI.SEARCH_ALGORITHMS)
+    rows = []
+
+    for algorithm in algorithms:
+        for depth in depths:
+            nodes = 0
+            elapsed = 0.0
+            moves = []
+            for fen in fens:
+                # Same opening move shuffle for every algorithm
+                random.seed(0)
+                board = chess.Board(fen)
+                start = time.monotonic()
+                result = ChessAI.search(board, depth=depth, use_book=False, algorithm=algorithm)
+                elapsed += time.monotonic() - start
+                nodes += result.nodes + result.qnodes
+                moves.append(result.move.uci() if result.move else None)
+
+            rows.append({
+                'algorithm': algorithm,
+                'depth': depth,
+                'nodes': nodes,
+                'time_ms': int(elapsed * 1000),
+                'nodes_per_second': int(nodes / elapsed) if elapsed else 0,
+                'moves': moves
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare search algorithms on the benchmark positions")
+    parser.add_argument("--depths", type=int, nargs="*", default=[3, 4, 5])
+    parser.add_argument("--algorithms", nargs="*", choices=ChessAI.SEARCH_ALGORITHMS,
+                        default=list(ChessAI.SEARCH_ALGORITHMS))
+    args = parser.parse_args()
+
+    print("Search algorithm benchmark")
+    print("=" * 26)
+    for row in benchmark(depths=args.depths, algorithms=args.algorithms):
+        print(f"{row['algorithm']:>8} depth {row['depth']}: {row['nodes']:>8} nodes "
+              f"{row['time_ms']:>7}ms {row['nodes_per_second']:>6} nps  {' '.join(map(str, row['moves']))}")
+
+
+if __name__ == "__main__":
+    main()
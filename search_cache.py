@@ -0,0 +1,165 @@
+# search_cache.py
+import os
+import time
+import random
+import logging
+import sqlite3
+from typing import NamedTuple, Optional
+
+import chess
+from dotenv import load_dotenv
+
+from profiling import RateLimitFilter
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+# A locked or damaged cache file fails every lookup; keep it from flooding the log
+logger.addFilter(RateLimitFilter())
+
+
+class CachedResult(NamedTuple):
+    depth: int
+    score: float
+    move: Optional[chess.Move]
+
+
+def _signed(key: int) -> int:
+    """Map an unsigned 64-bit Zobrist key onto SQLite's signed INTEGER range"""
+    return key - (1 << 64) if key >= (1 << 63) else key
+
+
+class SearchCache:
+    """Persistent root search results keyed by Zobrist hash, shared by processes and restarts.
+
+    Results are stored in a SQLite file (WAL mode) so every AI worker can read what the others
+    found. Each position keeps its deepest result; when the table grows past ``max_entries``
+    the least recently used rows are evicted.
+
+    The cache is an optimisation only: SQLite errors are logged and counted, and the search
+    goes on as if the position were not cached.
+    """
+
+    # Check the size bound every this many writes
+    EVICT_INTERVAL = 256
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 min_depth: Optional[int] = None):
+        self.path = path or os.getenv("SEARCH_CACHE_PATH", "search_cache.db")
+        self.max_entries = max_entries or int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 200000))
+        # 0 is a valid minimum (cache every result), so only None falls back to the environment
+        self.min_depth = min_depth if min_depth is not None else int(os.getenv("SEARCH_CACHE_MIN_DEPTH", 3))
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @staticmethod
+    def noisy_key(key: int, noise: int) -> int:
+        """Key for the results of searches with ``noise``, kept apart from the exact results.
+
+        A noisy result is a deliberately weaker move and must not be served to exact searches,
+        and an exact one would make a noisy level play at full strength. Each noise level gets
+        its own fixed salt, so games of the same level still share their results.
+        """
+        return key ^ random.Random(noise).getrandbits(64) if noise else key
+
+    def _failed(self, action: str, error: sqlite3.Error):
+        self.errors += 1
+        logger.warning(f"Search cache {action} failed on {self.path}: {error!r}")
+        # Reconnect on the next call, in case the connection itself is broken
+        self.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so each worker process gets its own connection
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key INTEGER PRIMARY KEY,
+                    depth INTEGER NOT NULL,
+                    score REAL NOT NULL,
+                    move TEXT,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache (last_used)")
+        return self._conn
+
+    def get(self, key: int, min_depth: int = 0) -> Optional[CachedResult]:
+        """Return the stored result for a position if it was searched at least ``min_depth`` deep"""
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT depth, score, move FROM search_cache WHERE key = ?",
+                               (_signed(key),)).fetchone()
+            if row is not None and row[0] >= min_depth:
+                conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (time.time(), _signed(key)))
+        except sqlite3.Error as error:
+            self._failed("lookup", error)
+            row = None
+        if row is None or row[0] < min_depth:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return CachedResult(row[0], row[1], chess.Move.from_uci(row[2]) if row[2] else None)
+
+    def put(self, key: int, depth: int, score: float, move: Optional[chess.Move]):
+        """Store a result unless a deeper one is already cached"""
+        if depth < self.min_depth:
+            return
+        try:
+            conn = self._connect()
+            conn.execute("""
+                INSERT INTO search_cache (key, depth, score, move, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    depth = excluded.depth, score = excluded.score, move = excluded.move,
+                    last_used = excluded.last_used
+                WHERE excluded.depth >= search_cache.depth
+            """, (_signed(key), depth, score, move.uci() if move else None, time.time()))
+            self.writes += 1
+
+            if self.writes % self.EVICT_INTERVAL == 0:
+                self.evict()
+        except sqlite3.Error as error:
+            self._failed("write", error)
+
+    def evict(self):
+        """Drop the least recently used rows beyond ``max_entries``"""
+        conn = self._connect()
+        excess = self.size() - self.max_entries
+        if excess > 0:
+            conn.execute("""
+                DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY last_used LIMIT ?
+                )
+            """, (excess,))
+            self.evictions += excess
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+    def counters(self) -> dict:
+        """Lookup and write counts of this process, cheap enough to send with every result"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'errors': self.errors
+        }
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return dict(self.counters(), path=self.path, size=self.size(), max_entries=self.max_entries,
+                    hit_rate=round(self.hits / lookups, 4) if lookups else 0.0)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,22 @@
+# tests/conftest.py
+import pytest
+
+from models import Database
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh database file for one test"""
+    monkeypatch.setattr(Database, "DB_PATH", str(tmp_path / "chess.db"))
+    Database.setup_database()
+    return Database
+
+
+
+@pytest.fixture(autouse=True, scope="session")
+def search_cache_path(tmp_path_factory):
+    """AI worker processes read SEARCH_CACHE_PATH when they start: keep their cache out of the tree"""
+    patch = pytest.MonkeyPatch()
+    patch.setenv("SEARCH_CACHE_PATH", str(tmp_path_factory.mktemp("search_cache") / "search_cache.db"))
+    yield
+    patch.undo()
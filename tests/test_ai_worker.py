@@ -0,0 +1,42 @@
+# tests/test_ai_worker.py
+import asyncio
+
+import chess
+
+from ai_worker import AIWorkerPool
+
+FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+
+
+def run(coroutine_function):
+    pool = AIWorkerPool(max_workers=1, ponder=False)
+
+    async def main():
+        try:
+            return await coroutine_function(pool)
+        finally:
+            pool.shutdown()
+    return asyncio.run(main())
+
+
+def test_profile_next_search():
+    async def search(pool):
+        waiter = pool.profile_next("game")
+        result = await pool.submit("game", FEN, depth=2)
+        return result, await waiter
+
+    result, profile = run(search)
+    assert chess.Move.from_uci(result['move']) in chess.Board(FEN).legal_moves
+    assert "function calls" in profile
+
+
+def test_cancelled_profile_request_is_dropped():
+    async def search(pool):
+        waiter = pool.profile_next("game")
+        pool.cancel_profile("game", waiter)
+        result = await pool.submit("game", FEN, depth=2)
+        return waiter, result
+
+    waiter, result = run(search)
+    assert waiter.cancelled()
+    assert result['profile'] is None
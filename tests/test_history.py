@@ -0,0 +1,113 @@
+# tests/test_history.py
+import random
+import sqlite3
+from array import array
+
+import chess
+import pytest
+
+from chess_engine import ChessGame, history_from_json, history_to_json, pack_move
+from replay import ReplayCache
+
+
+def random_game(rng: random.Random, max_plies: int = 300) -> chess.Board:
+    """A game of random legal moves, played until it ends or reaches ``max_plies``"""
+    board = chess.Board()
+    while not board.is_game_over() and board.ply() < max_plies:
+        board.push(rng.choice(list(board.legal_moves)))
+    return board
+
+
+def packed(board: chess.Board) -> array:
+    return array('H', (pack_move(move) for move in board.move_stack))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_json_round_trip(seed):
+    rng = random.Random(seed)
+    for _ in range(10):
+        moves = packed(random_game(rng))
+        assert history_from_json(history_to_json(moves)) == moves
+
+
+def test_legacy_blobs_migrate(database):
+    rng = random.Random(0)
+    games = []
+    for _ in range(20):
+        board = random_game(rng)
+        game_id = database.create_game(1, None, is_ai_game=True)
+        conn = sqlite3.connect(database.DB_PATH)
+        conn.execute("UPDATE games SET fen_position = ?, moves = ? WHERE id = ?",
+                     (board.fen(), history_to_json(packed(board)), game_id))
+        conn.commit()
+        conn.close()
+        games.append((game_id, board))
+
+    assert database.migrate_move_history() == len(games)
+    for game_id, board in games:
+        game = ChessGame(game_id, 1, None, is_ai_game=True)
+        assert game.moves == packed(board)
+        assert game.get_fen() == board.fen()
+        assert database.get_game_moves(game_id)[-1]['fen'] == board.fen()
+
+
+def test_game_continues_from_saved_position(database):
+    fen = "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2"
+    game_id = database.create_game(1, None, is_ai_game=True)
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute("UPDATE games SET fen_position = ? WHERE id = ?", (fen, game_id))
+    conn.commit()
+    conn.close()
+
+    game = ChessGame(game_id, 1, None, is_ai_game=True)
+    assert game.make_move(None, "f1", "b5")
+    assert [entry['san'] for entry in game.get_move_history()] == ["Bb5"]
+
+    reloaded = ChessGame(game_id, 1, None, is_ai_game=True)
+    assert reloaded.start_fen == fen
+    assert reloaded.moves == game.moves
+    assert reloaded.get_fen() == game.get_fen()
+
+    replay = ReplayCache().get(game_id)
+    assert replay.seek(0)['fen'] == fen
+    assert replay.seek(1)['san'] == "Bb5"
+
+
+def test_unreplayable_moves(database):
+    game_id = database.create_game(1, None, is_ai_game=True)
+    database.add_game_move(game_id, 0, "e2e4", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+    database.add_game_move(game_id, 1, "a1a8")
+
+    game = ChessGame(game_id, 1, None, is_ai_game=True)
+    assert len(game.moves) == 0
+    assert game.start_fen == game.get_fen()
+    assert game.get_move_history() == []
+
+    with pytest.raises(ValueError):
+        ReplayCache().get(game_id)
+
+
+def test_moves_store_san_and_fen(database):
+    game_id = database.create_game(1, None, is_ai_game=True)
+    game = ChessGame(game_id, 1, None, is_ai_game=True)
+    assert game.make_move(None, "e2", "e4")
+
+    row, = database.get_game_moves(game_id)
+    assert row['san'] == "e4"
+    assert row['fen'] == game.get_fen()
+
+
+def test_failed_migration_keeps_the_blob(database):
+    game_id = database.create_game(1, None, is_ai_game=True)
+    blob = history_to_json(array('H', [pack_move(chess.Move.from_uci("e2e4")),
+                                       pack_move(chess.Move.from_uci("e7e5"))]))
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute("UPDATE games SET moves = ? WHERE id = ?", (blob, game_id))
+    # A conflicting row from an earlier, interrupted copy
+    conn.execute("INSERT INTO game_moves (game_id, ply, uci) VALUES (?, 5, 'g1f3')", (game_id,))
+    conn.commit()
+    conn.close()
+
+    assert database.migrate_move_history() == 0
+    assert database.get_game(game_id)['moves'] == blob
+    assert [row['ply'] for row in database.get_game_moves(game_id)] == [5]
@@ -0,0 +1,53 @@
+# tests/test_incremental_eval.py
+import random
+
+import chess
+import pytest
+
+from chess_ai import ChessAI, IncrementalEvaluator
+
+TOLERANCE = 1e-6
+
+
+def assert_matches_full_evaluation(board: chess.Board, evaluator: IncrementalEvaluator):
+    assert evaluator.score == pytest.approx(ChessAI.evaluate_material(board), abs=TOLERANCE), board.fen()
+    full = ChessAI.evaluate_position(board, check_terminal=False)
+    incremental = ChessAI.evaluate_position(board, evaluator.score, check_terminal=False)
+    assert incremental == pytest.approx(full, abs=TOLERANCE), board.fen()
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_games(seed):
+    """After every push and pop, along random games that also try and take back a second move"""
+    rng = random.Random(seed)
+    for _ in range(10):
+        board = chess.Board()
+        evaluator = IncrementalEvaluator(board)
+        assert_matches_full_evaluation(board, evaluator)
+        for _ in range(200):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            evaluator.push(board, rng.choice(moves))
+            assert_matches_full_evaluation(board, evaluator)
+            evaluator.pop(board)
+            assert_matches_full_evaluation(board, evaluator)
+            evaluator.push(board, rng.choice(moves))
+            assert_matches_full_evaluation(board, evaluator)
+
+
+@pytest.mark.parametrize("fen, uci", [
+    ("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1", "e1g1"),
+    ("r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1", "e8c8"),
+    ("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2", "e5d6"),
+    ("1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1", "a7b8n"),
+    ("4k3/8/8/8/8/8/p7/1N2K3 b - - 0 1", "a2b1q"),
+])
+def test_special_moves(fen, uci):
+    board = chess.Board(fen)
+    evaluator = IncrementalEvaluator(board)
+    evaluator.push(board, chess.Move.from_uci(uci))
+    assert_matches_full_evaluation(board, evaluator)
+    evaluator.pop(board)
+    assert board.fen() == fen
+    assert_matches_full_evaluation(board, evaluator)
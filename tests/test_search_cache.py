@@ -0,0 +1,40 @@
+# tests/test_search_cache.py
+import chess
+
+from chess_ai import ChessAI
+from search_cache import SearchCache
+from transposition import zobrist_key
+
+FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+
+
+def test_noisy_results_are_kept_apart(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "cache.db"), min_depth=0)
+    board = chess.Board(FEN)
+
+    noisy = ChessAI.search(board, depth=2, cache=cache, noise=15)
+    assert not noisy.from_cache
+    assert ChessAI.search(board, depth=2, cache=cache, noise=15).from_cache
+    assert not ChessAI.search(board, depth=2, cache=cache).from_cache
+    assert cache.get(SearchCache.noisy_key(zobrist_key(board), 30)) is None
+
+
+def test_stale_entry_is_ignored(tmp_path):
+    cache = SearchCache(path=str(tmp_path / "cache.db"), min_depth=0)
+    board = chess.Board(FEN)
+    cache.put(zobrist_key(board), 5, 0, chess.Move.from_uci("a7a5"))
+
+    result = ChessAI.search(board, depth=2, cache=cache)
+    assert result.move in board.legal_moves
+    assert not result.from_cache
+
+
+def test_damaged_file_falls_back_to_search(tmp_path):
+    path = tmp_path / "cache.db"
+    path.write_bytes(b"not a database" * 100)
+    cache = SearchCache(path=str(path), min_depth=0)
+    board = chess.Board(FEN)
+
+    result = ChessAI.search(board, depth=2, cache=cache)
+    assert result.move in board.legal_moves
+    assert cache.errors == 2
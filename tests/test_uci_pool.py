@@ -0,0 +1,87 @@
+# tests/test_uci_pool.py
+import os
+import sys
+import asyncio
+import shlex
+
+import chess
+
+from uci_pool import UCIEnginePool
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uci_stub.py")
+FEN = "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+
+
+def make_pool(*stub_args, size=1) -> UCIEnginePool:
+    command = " ".join(shlex.quote(part) for part in (sys.executable, STUB) + stub_args)
+    return UCIEnginePool(command=command, size=size, options={}, health_interval=60, timeout=5)
+
+
+def run(pool: UCIEnginePool, coroutine_function):
+    async def main():
+        try:
+            return await coroutine_function()
+        finally:
+            # Let the engines finish starting so shutdown() can close them all
+            if pool._start_task is not None:
+                await asyncio.gather(pool._start_task, return_exceptions=True)
+            pool.shutdown()
+    return asyncio.run(main())
+
+
+def test_submit_returns_legal_move():
+    pool = make_pool()
+
+    async def search():
+        return await pool.submit("game", FEN, depth=1)
+
+    result = run(pool, search)
+    assert chess.Move.from_uci(result['move']) in chess.Board(FEN).legal_moves
+    assert pool.completed == 1
+    assert not pool.has_job("game")
+
+
+def test_cancel_while_engines_start():
+    pool = make_pool()
+
+    async def search():
+        task = asyncio.ensure_future(pool.submit("game", FEN, depth=1))
+        await asyncio.sleep(0)
+        assert pool.has_job("game")
+        pool.cancel("game")
+        return await task
+
+    assert run(pool, search) is None
+    assert pool.cancelled == 1
+    assert pool.completed == 0
+    assert all(slot.searches == 0 for slot in pool._slots)
+
+
+def test_cancel_running_search():
+    pool = make_pool("--delay", "1")
+
+    async def search():
+        await pool.submit("warm-up", FEN, depth=1)
+        task = asyncio.ensure_future(pool.submit("game", FEN, depth=1))
+        await asyncio.sleep(0.3)
+        pool.cancel("game")
+        return await task
+
+    assert run(pool, search) is None
+    assert pool.completed == 1
+    assert not pool.has_job("game")
+
+
+def test_restart_after_crash():
+    pool = make_pool("--crash-after", "1")
+
+    async def search():
+        first = await pool.submit("game", FEN, depth=1)
+        second = await pool.submit("game", FEN, depth=1)
+        return first, second
+
+    first, second = run(pool, search)
+    assert first is not None and second is not None
+    assert pool.failures == 1
+    assert pool._slots[0].restarts == 1
+    assert pool.completed == 2
@@ -0,0 +1,195 @@
+# transposition.py
+import os
+from array import array
+
+import chess
+import chess.polyglot
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Bound types stored with each entry
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class TTEntry(NamedTuple):
+    key: int
+    depth: int
+    score: float
+    bound: int
+    move: Optional[chess.Move]
+    generation: int
+
+
+# Polyglot random numbers, for updating keys move by move
+_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+_HASHER = chess.polyglot.ZobristHasher(_RANDOM)
+_TURN_KEY = _RANDOM[780]
+_PIECE_KEYS = {
+    color: {
+        piece_type: [_RANDOM[64 * ((piece_type - 1) * 2 + color) + square] for square in chess.SQUARES]
+        for piece_type in chess.PIECE_TYPES
+    }
+    for color in chess.COLORS
+}
+
+
+def zobrist_key(board: chess.Board) -> int:
+    """Return the 64-bit Zobrist hash of a position (polyglot keys)"""
+    return chess.polyglot.zobrist_hash(board)
+
+
+def castling_key(board: chess.Board) -> int:
+    """Castling-rights part of a position's Zobrist key"""
+    return _HASHER.hash_castling(board)
+
+
+def en_passant_key(board: chess.Board) -> int:
+    """En passant part of a position's Zobrist key (only set when the capture is possible)"""
+    return _HASHER.hash_ep_square(board) if board.ep_square is not None else 0
+
+
+def move_key_delta(board: chess.Board, move: chess.Move) -> int:
+    """Key change of a move from pieces, turn and the current en passant square.
+
+    Computed before the move is pushed. The caller adds the new position's en passant part
+    and, when the castling rights changed, the castling difference.
+    """
+    delta = _TURN_KEY ^ en_passant_key(board)
+    if not move:
+        return delta
+
+    color = board.turn
+    keys = _PIECE_KEYS[color]
+    from_sq, to_sq = move.from_square, move.to_square
+    piece_type = board.piece_type_at(from_sq)
+    delta ^= keys[piece_type][from_sq] ^ keys[move.promotion or piece_type][to_sq]
+
+    if board.is_castling(move):
+        rank = chess.square_rank(from_sq)
+        if chess.square_file(to_sq) > chess.square_file(from_sq):
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+        else:
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        delta ^= keys[chess.ROOK][rook_from] ^ keys[chess.ROOK][rook_to]
+    elif board.is_en_passant(move):
+        captured_sq = to_sq - 8 if color else to_sq + 8
+        delta ^= _PIECE_KEYS[not color][chess.PAWN][captured_sq]
+    else:
+        captured = board.piece_type_at(to_sq)
+        if captured:
+            delta ^= _PIECE_KEYS[not color][captured][to_sq]
+
+    return delta
+
+
+class TranspositionTable:
+    """Bounded transposition table with a depth-preferred replacement scheme.
+
+    Entries live in a fixed number of slots indexed by ``key % size``. A slot is
+    overwritten when it is empty, holds the same position, holds an entry from an
+    older search, or holds a shallower (or equally deep) result.
+
+    Slots are three flat arrays (key, score, and depth/bound/move/generation packed into
+    one 64-bit word), so an entry costs exactly ``ENTRY_BYTES`` and ``size_mb`` is the
+    table's real size. ``probe`` unpacks a hit into a ``TTEntry``.
+    """
+
+    # key (8) + score (8) + packed move, bound, depth and generation (8)
+    ENTRY_BYTES = 24
+    DEFAULT_SIZE_MB = float(os.getenv("AI_TT_SIZE_MB", 8))
+
+    # Layout of the packed word; 0 marks an empty slot
+    _OCCUPIED = 1 << 63
+    _DEPTH_OFFSET = 1 << 15
+
+    def __init__(self, size_mb: Optional[float] = None):
+        if size_mb is None:
+            size_mb = self.DEFAULT_SIZE_MB
+        self.size = max(1, int(size_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        self._allocate()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+        self.stores = 0
+
+    def _allocate(self):
+        self.keys = array('Q', bytes(8 * self.size))
+        self.scores = array('d', bytes(8 * self.size))
+        self.data = array('Q', bytes(8 * self.size))
+
+    def new_search(self):
+        """Age existing entries so a new search may replace them"""
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        """Look up a position, returning its entry or None"""
+        index = key % self.size
+        data = self.data[index]
+        if data and self.keys[index] == key:
+            self.hits += 1
+            packed_move = data & 0xFFFF
+            move = chess.Move(packed_move & 0x3F, packed_move >> 6 & 0x3F,
+                              promotion=(packed_move >> 12) or None) if packed_move else None
+            score = self.scores[index]
+            return TTEntry(key, (data >> 18 & 0xFFFF) - self._DEPTH_OFFSET,
+                           int(score) if score.is_integer() else score,
+                           data >> 16 & 0x3, move, data >> 34 & 0x1FFFFFFF)
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, score: float, bound: int, move: Optional[chess.Move] = None):
+        """Store a search result, keeping the deeper entry on collisions"""
+        index = key % self.size
+        current = self.data[index]
+        generation = self.generation & 0x1FFFFFFF
+
+        if current:
+            same_search = (current >> 34 & 0x1FFFFFFF) == generation
+            deeper = (current >> 18 & 0xFFFF) - self._DEPTH_OFFSET > depth
+            if self.keys[index] == key:
+                # Same position: keep a deeper result from this search, but never lose its move
+                if same_search and deeper:
+                    return
+                packed_move = current & 0xFFFF if move is None else 0
+            elif same_search and deeper:
+                return
+            else:
+                self.overwrites += 1
+                packed_move = 0
+        else:
+            packed_move = 0
+
+        if move is not None:
+            packed_move = move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+        self.keys[index] = key
+        self.scores[index] = score
+        self.data[index] = (self._OCCUPIED | generation << 34 | (depth + self._DEPTH_OFFSET) << 18
+                            | bound << 16 | packed_move)
+        self.stores += 1
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        self._allocate()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+        self.stores = 0
+
+    def get_stats(self) -> dict:
+        """Return hit/miss/overwrite counters for monitoring"""
+        probes = self.hits + self.misses
+        return {
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'overwrites': self.overwrites,
+            'stores': self.stores,
+            'hit_rate': round(self.hits / probes, 4) if probes else 0.0
+        }
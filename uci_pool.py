@@ -0,0 +1,310 @@
+# uci_pool.py
+import os
+import time
+import shlex
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import chess
+import chess.engine
+from dotenv import load_dotenv
+
+from chess_ai import board_from_history
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Errors after which an engine process is restarted
+ENGINE_ERRORS = (chess.engine.EngineError, chess.engine.EngineTerminatedError, asyncio.TimeoutError, OSError)
+
+
+def parse_options(text: str) -> dict:
+    """Parse "Hash=64,Threads=1" into UCI options"""
+    options = {}
+    for item in text.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            options[name.strip()] = value.strip()
+    return options
+
+
+class EngineSlot:
+    """One engine process and the game it last searched for"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.transport = None
+        self.engine = None
+        self.game_id = None
+        self.busy = False
+        self.searches = 0
+        self.restarts = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.engine is not None and not self.engine.returncode.done()
+
+
+class UCIEnginePool:
+    """Long-lived UCI engine processes shared by all AI games (alternative to ``ChessAI``).
+
+    ``submit``, ``cancel``, ``has_job`` and ``get_stats`` match ``AIWorkerPool`` so the
+    handlers can use either backend. Each game has at most one search in flight and waiting
+    games are served first come, first served, so one busy game cannot starve the others.
+    A game goes back to the engine that searched it last when that engine is free; engines
+    get ``ucinewgame`` whenever they switch games. Idle engines are pinged periodically and
+    engines that crash, hang or fail a ping are restarted.
+    """
+
+    def __init__(self, command: Optional[str] = None, size: Optional[int] = None,
+                 options: Optional[dict] = None, health_interval: Optional[float] = None,
+                 timeout: Optional[float] = None):
+        self.command = shlex.split(command or os.getenv("UCI_ENGINE_PATH", ""))
+        self.size = size or int(os.getenv("UCI_POOL_SIZE", 2))
+        self.options = options if options is not None else parse_options(os.getenv("UCI_ENGINE_OPTIONS", ""))
+        self.health_interval = health_interval or float(os.getenv("UCI_HEALTH_INTERVAL", 30))
+        # Grace period on top of a search's time limit before the engine counts as hung
+        self.timeout = timeout or float(os.getenv("UCI_ENGINE_TIMEOUT", 10))
+        self._slots = [EngineSlot(index) for index in range(self.size)]
+        self._waiting = OrderedDict()
+        self._jobs = {}
+        self._start_task = None
+        self._health_task = None
+
+        # Counters
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failures = 0
+
+    def start(self):
+        """Launch the engines in the background (the first search also does this)"""
+        if self._start_task is None:
+            self._start_task = asyncio.ensure_future(self._start())
+
+    async def _start(self):
+        if not self.command:
+            raise RuntimeError("UCI_ENGINE_PATH is not set")
+        results = await asyncio.gather(*(self._launch(slot) for slot in self._slots), return_exceptions=True)
+        for slot, error in zip(self._slots, results):
+            if isinstance(error, Exception):
+                logger.error(f"UCI engine {slot.index} failed to start: {error}")
+        self._health_task = asyncio.ensure_future(self._health_loop())
+        logger.info(f"UCI engine pool started with {self.size} engines: {' '.join(self.command)}")
+
+    async def _launch(self, slot: EngineSlot):
+        slot.transport, slot.engine = await asyncio.wait_for(chess.engine.popen_uci(self.command), self.timeout)
+        slot.game_id = None
+        for name, value in self.options.items():
+            try:
+                await slot.engine.configure({name: value})
+            except chess.engine.EngineError as error:
+                logger.warning(f"UCI engine {slot.index} rejected option {name}: {error}")
+
+    async def _restart(self, slot: EngineSlot):
+        """Replace a crashed or unresponsive engine process"""
+        if slot.transport is not None and not slot.transport.is_closing():
+            slot.transport.close()
+        slot.transport = None
+        slot.engine = None
+        slot.restarts += 1
+        logger.warning(f"Restarting UCI engine {slot.index}")
+        await self._launch(slot)
+
+    def shutdown(self):
+        """Stop the health checks and kill the engine processes"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for slot in self._slots:
+            if slot.transport is not None:
+                slot.transport.close()
+                slot.transport = None
+                slot.engine = None
+        self._start_task = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for slot in self._slots:
+                if slot.busy:
+                    continue
+                slot.busy = True
+                try:
+                    if not await self._healthy(slot):
+                        await self._restart(slot)
+                except ENGINE_ERRORS as error:
+                    logger.error(f"UCI engine {slot.index} could not be restarted: {error}")
+                finally:
+                    self._release(slot)
+
+    async def _healthy(self, slot: EngineSlot) -> bool:
+        if not slot.alive:
+            return False
+        try:
+            await asyncio.wait_for(slot.engine.ping(), self.timeout)
+            return True
+        except ENGINE_ERRORS:
+            return False
+
+    def _idle_slot(self, game_id: str) -> Optional[EngineSlot]:
+        """A free engine, preferring the one that searched this game last"""
+        idle = [slot for slot in self._slots if not slot.busy]
+        for slot in idle:
+            if slot.game_id == game_id:
+                return slot
+        return idle[0] if idle else None
+
+    async def _acquire(self, game_id: str) -> EngineSlot:
+        slot = self._idle_slot(game_id)
+        if slot is not None and not self._waiting:
+            slot.busy = True
+            return slot
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting[game_id] = waiter
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # Handed an engine just as the wait was cancelled: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            raise
+        finally:
+            if self._waiting.get(game_id) is waiter:
+                del self._waiting[game_id]
+
+    def _release(self, slot: EngineSlot):
+        """Give a freed engine to the game that has waited longest"""
+        while self._waiting:
+            _, waiter = self._waiting.popitem(last=False)
+            if not waiter.done():
+                waiter.set_result(slot)
+                return
+        slot.busy = False
+
+    async def submit(self, game_id: str, fen: str, depth: Optional[int] = None,
+                     time_limit: Optional[float] = None, node_limit: Optional[int] = None,
+                     noise: int = 0, history: Optional[tuple] = None) -> Optional[dict]:
+        """Search ``fen`` with a pooled engine, returning None if cancelled or every attempt failed.
+
+        ``noise`` is accepted for compatibility with ``AIWorkerPool`` and ignored. The moves of
+        ``history`` are sent with the position so the engine sees repetitions.
+        """
+        # A newer search for the same game supersedes the old one. The job is registered before
+        # the first await so a cancel() while the engines start is not lost.
+        self.cancel(game_id)
+        job = self._jobs[game_id] = {'task': asyncio.current_task()}
+        self.submitted += 1
+
+        limit = chess.engine.Limit(time=time_limit, depth=depth, nodes=node_limit)
+        try:
+            self.start()
+            try:
+                await asyncio.shield(self._start_task)
+            except RuntimeError as error:
+                logger.error(f"UCI engine pool unavailable: {error}")
+                return None
+
+            slot = await self._acquire(game_id)
+            try:
+                result = await self._play(slot, game_id, board_from_history(fen, history), limit)
+            finally:
+                self._release(slot)
+        except asyncio.CancelledError:
+            return None
+        finally:
+            if self._jobs.get(game_id) is job:
+                del self._jobs[game_id]
+
+        if result is not None:
+            self.completed += 1
+        return result
+
+    async def _play(self, slot: EngineSlot, game_id: str, board: chess.Board,
+                    limit: chess.engine.Limit) -> Optional[dict]:
+        """Run one search, restarting the engine and retrying once if it fails"""
+        for attempt in range(2):
+            try:
+                if not slot.alive:
+                    await self._restart(slot)
+                start = time.monotonic()
+                # ``game`` makes python-chess send ucinewgame when the engine switches games
+                play = await asyncio.wait_for(
+                    slot.engine.play(board, limit, game=game_id, info=chess.engine.INFO_BASIC | chess.engine.INFO_SCORE),
+                    (limit.time or 0) + self.timeout
+                )
+            except ENGINE_ERRORS as error:
+                self.failures += 1
+                logger.warning(f"UCI engine {slot.index} failed (attempt {attempt + 1}): {error!r}")
+                # Kill it so the next attempt (or search) starts a fresh process
+                if slot.transport is not None:
+                    slot.transport.close()
+                slot.transport = None
+                slot.engine = None
+                continue
+
+            slot.game_id = game_id
+            slot.searches += 1
+            info = play.info
+            score = info.get('score')
+            return {
+                'move': play.move.uci() if play.move else None,
+                'score': score.white().score(mate_score=20000) if score else 0,
+                'depth': info.get('depth', 0),
+                'nodes': info.get('nodes', 0),
+                'qnodes': 0,
+                'time_ms': int((time.monotonic() - start) * 1000),
+                'from_book': False,
+                'from_cache': False,
+                'ponder': play.ponder.uci() if play.ponder else None
+            }
+        return None
+
+    def ponder(self, game_id: str, fen: str, depth: Optional[int] = None, node_limit: Optional[int] = None,
+               noise: int = 0, history: Optional[tuple] = None, time_limit: Optional[float] = None) -> bool:
+        """Pondering is not used with UCI engines"""
+        return False
+
+    def profile_next(self, game_id: str) -> None:
+        """Searches run in external engines, which cannot be profiled from here"""
+        return None
+
+    def cancel_profile(self, game_id: str, waiter):
+        """Nothing to withdraw: ``profile_next`` never registers a request"""
+
+    def cancel(self, game_id: str):
+        """Cancel the waiting or running search for a game, if any"""
+        job = self._jobs.pop(game_id, None)
+        if job is None:
+            return
+        self.cancelled += 1
+        if job['task'] is not None and job['task'] is not asyncio.current_task():
+            # A running engine.play is stopped by python-chess ("stop") when cancelled
+            job['task'].cancel()
+
+    def has_job(self, game_id: str) -> bool:
+        """Whether a search is waiting or running for a game"""
+        return game_id in self._jobs
+
+    def get_stats(self) -> dict:
+        return {
+            'engines': self.size,
+            'alive': sum(1 for slot in self._slots if slot.alive),
+            'busy': sum(1 for slot in self._slots if slot.busy),
+            'waiting': len(self._waiting),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'failures': self.failures,
+            'restarts': sum(slot.restarts for slot in self._slots),
+            'searches': [slot.searches for slot in self._slots]
+        }
+
+
+# Shared pool used by the websocket handlers when AI_BACKEND=uci
+uci_pool = UCIEnginePool()
@@ -0,0 +1,87 @@
+# uci_stub.py
+"""
+Minimal UCI engine for exercising the UCI engine pool without an external engine.
+
+It speaks enough of the protocol for python-chess (uci, isready, setoption, ucinewgame,
+position, go, stop, quit) and answers every ``go`` at once with a capture if it has one,
+otherwise a random legal move. ``--crash-after N`` exits after N searches and ``--delay S``
+waits S seconds per search, to test restarts and timeouts.
+
+    UCI_ENGINE_PATH="python uci_stub.py"
+"""
+
+import sys
+import time
+import random
+import argparse
+
+import chess
+
+
+def choose_move(board: chess.Board, rng: random.Random) -> chess.Move:
+    """Capture the most valuable piece available, else play a random move"""
+    moves = list(board.legal_moves)
+    captures = [move for move in moves if board.is_capture(move) and not board.is_en_passant(move)]
+    if captures:
+        return max(captures, key=lambda move: board.piece_type_at(move.to_square))
+    return rng.choice(moves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub UCI engine")
+    parser.add_argument("--crash-after", type=int, default=0, help="exit after this many searches")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to 'think' per search")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    board = chess.Board()
+    searches = 0
+
+    def send(line: str):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    for line in sys.stdin:
+        tokens = line.split()
+        if not tokens:
+            continue
+        command = tokens[0]
+
+        if command == "uci":
+            send("id name UCI Stub")
+            send("id author chess-online")
+            send("option name Hash type spin default 16 min 1 max 1024")
+            send("uciok")
+        elif command == "isready":
+            send("readyok")
+        elif command == "ucinewgame":
+            board = chess.Board()
+        elif command == "position":
+            if len(tokens) > 1 and tokens[1] == "fen":
+                end = tokens.index("moves") if "moves" in tokens else len(tokens)
+                board = chess.Board(" ".join(tokens[2:end]))
+            else:
+                board = chess.Board()
+            if "moves" in tokens:
+                for uci in tokens[tokens.index("moves") + 1:]:
+                    board.push_uci(uci)
+        elif command == "go":
+            searches += 1
+            if args.crash_after and searches > args.crash_after:
+                sys.exit(1)
+            if args.delay:
+                time.sleep(args.delay)
+            if board.is_game_over():
+                send("bestmove (none)")
+                continue
+            move = choose_move(board, rng)
+            send(f"info depth 1 score cp 0 nodes {board.legal_moves.count()} time 0 pv {move.uci()}")
+            send(f"bestmove {move.uci()}")
+        elif command == "quit":
+            break
+        # setoption and stop need no answer: searches finish immediately
+
+
+if __name__ == "__main__":
+    main()